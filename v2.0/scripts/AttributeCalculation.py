@@ -47,12 +47,16 @@
 import os
 import math
 import json
+import numpy as np
 import logging
+import multiprocessing
 from osgeo import ogr, gdal
-from rasterstats import zonal_stats
 from geojson import Feature, FeatureCollection
 
 from BasicProcessing import BasicProcessing
+from BufferCache import BufferCache
+from ProfileSampling import ProfileSampling
+from ZonalStatistics import ZonalStatistics
 
 class AttributeCalculation(BasicProcessing):
 
@@ -67,16 +71,26 @@ class AttributeCalculation(BasicProcessing):
 
     ID_ATTRIB = 'ID'
 
+    CHUNKS_PER_WORKER = 4
+    # Feature IDs selected by one SQL statement of a chunk, keeps the statements short
+    FID_BATCH = 1000
+
+    GRADIENT_BUFFER = 'buffer'
+    GRADIENT_PROFILE = 'profile'
+
     def __init__(self):
         super(AttributeCalculation, self).__init__()
         self._inputFileName = None
         self._inputDataSource = None
         self._inputLayer = None
+        self._inputLayerHash = None
+        self._bufferCache = None
 
     def _prepareLayer(self, fileName, driverName = None):
         if not fileName:
             fileName = self._configValue("SegmentShapeFile")
         self._inputFileName = self.getInputFilePath(fileName)
+        self._inputLayerHash = None
         self._inputDataSource, self._inputLayer = self._prepareInputLayer(self._inputFileName, driverName)
         return self._inputLayer
 
@@ -91,14 +105,17 @@ class AttributeCalculation(BasicProcessing):
         layer = self._inputLayer
         self._prepareLayerFields(layer)
         
-        calcFuncs = [AttributeCalculation._calcID, 
-                     AttributeCalculation._calcVertices,
-                     AttributeCalculation._calcLength,
-                     AttributeCalculation._calcAzimuth, 
-                     AttributeCalculation._calcSinuosity]
-
         self._print("Calculating Attributes ({0} features)...".format(layer.GetFeatureCount()), logging.INFO)
-        self._calculateLayer(layer, calcFuncs)
+        if self._configValue("BatchAttributeCalculation"):
+            coordinates, offsets, partOffsets = self._readLineCoordinates(layer, withParts=True)
+            self._setLayerFields(layer, AttributeCalculation._calcGeometryAttributes(coordinates, offsets, partOffsets))
+        else:
+            calcFuncs = [AttributeCalculation._calcID, 
+                         AttributeCalculation._calcVertices,
+                         AttributeCalculation._calcLength,
+                         AttributeCalculation._calcAzimuth, 
+                         AttributeCalculation._calcSinuosity]
+            self._calculateLayer(layer, calcFuncs)
         layer.SyncToDisk()
         self._print("Attributes calculated.", logging.INFO)
         return True
@@ -125,7 +142,7 @@ class AttributeCalculation(BasicProcessing):
 
     @staticmethod
     def _calcVertices(index, feature, geometry):
-        feature.SetField('vertices', geometry.GetPointCount())
+        feature.SetField('vertices', sum(part.GetPointCount() for part in BasicProcessing._lineParts(geometry)))
 
     @staticmethod
     def _calcLength(index, feature, geometry):
@@ -155,10 +172,17 @@ class AttributeCalculation(BasicProcessing):
         compass_bearing = (initial_bearing + 360) % 360
         return compass_bearing
 
+    @staticmethod
+    def _lineEnds(geometry):
+        """
+        First and last vertex of a line, of the first and last part of a multi-part line.
+        """
+        parts = [part for part in BasicProcessing._lineParts(geometry) if part.GetPointCount() > 0]
+        return parts[0].GetPoint(0), parts[-1].GetPoint(parts[-1].GetPointCount() - 1)
+
     @staticmethod
     def _calcAzimuth(index, feature, geometry):
-        startPoint = geometry.GetPoint(0)
-        endPoint = geometry.GetPoint(geometry.GetPointCount() - 1)
+        startPoint, endPoint = AttributeCalculation._lineEnds(geometry)
         feature.SetField('azimuth', AttributeCalculation._getAzimuth(startPoint, endPoint))
 
     @staticmethod
@@ -171,8 +195,7 @@ class AttributeCalculation(BasicProcessing):
         :Source:
           https://community.esri.com/thread/39734
         """
-        startPoint = geometry.GetPoint(0)
-        endPoint = geometry.GetPoint(geometry.GetPointCount() - 1)
+        startPoint, endPoint = AttributeCalculation._lineEnds(geometry)
         startPoint_geom = ogr.Geometry(ogr.wkbPoint)
         endPoint_geom = ogr.Geometry(ogr.wkbPoint)
         startPoint_geom.AddPoint(startPoint[0], startPoint[1])
@@ -182,18 +205,76 @@ class AttributeCalculation(BasicProcessing):
             dist = geometry.Length() / dist
         feature.SetField('sinuosity', dist)
 
+    @staticmethod
+    def _calcGeometryAttributes(coordinates, offsets, partOffsets = None):
+        """
+        Batch version of the _calc... functions: calculates ID, vertices, length, azimuth and sinuosity of
+        all lines at once from the coordinate array and the offsets returned by _readLineCoordinates.
+        With partOffsets the gaps between the parts of multi-part lines are not counted in the length.
+        Lines without vertices get NaN values.
+        """
+        count = len(offsets) - 1
+        vertices = np.diff(offsets)
+        valid = vertices > 0
+
+        # Segment lengths, the segments connecting the last vertex of a line or part to the next one are dropped
+        segments = np.hypot(*np.diff(coordinates, axis=0).T) if len(coordinates) > 1 else np.zeros(0)
+        breaks = (offsets if partOffsets is None else partOffsets)[1:-1]
+        segments[breaks[(breaks > 0) & (breaks < len(coordinates))] - 1] = 0.0
+        cumulated = np.concatenate(([0.0], np.cumsum(segments)))
+        startIndex = np.minimum(offsets[:-1], max(len(coordinates) - 1, 0))
+        endIndex = np.maximum(offsets[1:] - 1, 0)
+        length = np.full(count, np.nan)
+        length[valid] = cumulated[endIndex[valid]] - cumulated[startIndex[valid]]
+
+        # Azimuth, same formula as _getAzimuth
+        startPoints = coordinates[startIndex[valid]]
+        endPoints = coordinates[endIndex[valid]]
+        lat1 = np.radians(startPoints[:, 0])
+        lat2 = np.radians(endPoints[:, 0])
+        diffLong = np.radians(endPoints[:, 1] - startPoints[:, 1])
+        x = np.sin(diffLong) * np.cos(lat2)
+        y = np.cos(lat1) * np.sin(lat2) - (np.sin(lat1) * np.cos(lat2) * np.cos(diffLong))
+        azimuth = np.full(count, np.nan)
+        azimuth[valid] = (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+        # Sinuosity, 0 for closed lines as in _calcSinuosity
+        distance = np.hypot(*(endPoints - startPoints).T)
+        ratio = np.zeros(len(distance))
+        np.divide(length[valid], distance, out=ratio, where=distance != 0)
+        sinuosity = np.full(count, np.nan)
+        sinuosity[valid] = ratio
+
+        return {AttributeCalculation.ID_ATTRIB: np.arange(1, count + 1),
+                'vertices': vertices,
+                'length': length,
+                'azimuth': azimuth,
+                'sinuosity': sinuosity}
+
     ### Single Sided Buffer
 
-    def createBuffers(self, fileName, driverName = None, inMemory = False, asShape = False, asFileName = True):
+    def createBuffers(self, fileName, driverName = None, inMemory = False, asShape = False, asFileName = True, asGeometries = False, useCache = True):
         if self._inputLayer is None and self._prepareLayer(fileName, driverName) is None:
             return None, None
         distance = self._configValue("BufferDistance")
-        return self.createBuffer(distance, AttributeCalculation.LEFTSIDE, fileName, driverName, inMemory=inMemory, asShape=asShape, asFileName=asFileName), \
-            self.createBuffer(distance, AttributeCalculation.RIGHTSIDE, fileName, driverName, inMemory=inMemory, asShape=asShape, asFileName=asFileName)
+        return self.createBuffer(distance, AttributeCalculation.LEFTSIDE, fileName, driverName, inMemory=inMemory, asShape=asShape, asFileName=asFileName, asGeometries=asGeometries, useCache=useCache), \
+            self.createBuffer(distance, AttributeCalculation.RIGHTSIDE, fileName, driverName, inMemory=inMemory, asShape=asShape, asFileName=asFileName, asGeometries=asGeometries, useCache=useCache)
 
-    def createBuffer(self, bufferDistance, side, fileName, driverName = None, inMemory = False, asShape = False, asFileName = True):
-        if self._inputLayer is None or self._prepareLayer(fileName, driverName) is None:
+    def createBuffer(self, bufferDistance, side, fileName, driverName = None, inMemory = False, asShape = False, asFileName = True, asGeometries = False, useCache = True):
+        """
+        Creates the single sided buffer of the input layer on the given side.
+        Returns the buffer file name (asFileName), a list of (ID, geometry) tuples which is handed to
+        the zonal statistics without any data source (asGeometries) or the buffer features as GeoJson.
+        Buffer files are taken from the buffer cache unless useCache is false.
+        """
+        if self._inputLayer is None and self._prepareLayer(fileName, driverName) is None:
             return None
+        # Buffers kept in memory are never written to the cache
+        bufferCache = None if inMemory or asGeometries or not useCache else self._getBufferCache()
+        if bufferCache is not None:
+            return self._createCachedBuffer(bufferCache, bufferDistance, side, asFileName)
+        if asGeometries:
+            return self._createSingleSidedBufferGeometries(bufferDistance, side)
         fileName = '{0}_buffer{1}'.format(self._inputLayer.GetName(), AttributeCalculation.SIDES[side])
         if inMemory:
             driverName = BasicProcessing.DRIVER_MEM
@@ -205,31 +286,56 @@ class AttributeCalculation(BasicProcessing):
             driverName = BasicProcessing.DRIVER_JSON
             fileName = self.getTempFilePath('{0}.json'.format(fileName))
         
-        bufferExists = False
-        bufferLayer = None
-        bufferDatasource = None
+        # Buffers of earlier runs may belong to other lines or distances, they are always recreated
         if not inMemory and os.path.isfile(fileName):
-            bufferExists = True
-        if bufferExists:
-            self._print("SingleSided Buffer at Distance {0} on {1} Side already exists.". format(
-                bufferDistance, AttributeCalculation.SIDES[side]), logging.INFO)
-            if not asFileName:
-                bufferDatasource, bufferLayer = self._openVectorLayer(fileName, driverName)
-        else:
-            bufferDatasource = self._createDataSource(fileName, driverName)
-            if bufferDatasource is not None:
-                bufferLayer = self._createSingleSidedBufferLayer(bufferDatasource, bufferDistance, side, not asShape) #inMemory)
+            BasicProcessing._getDriver(driverName).DeleteDataSource(fileName)
+        bufferLayer = None
+        bufferDatasource = self._createDataSource(fileName, driverName)
+        if bufferDatasource is not None:
+            bufferLayer = self._createSingleSidedBufferLayer(bufferDatasource, bufferDistance, side, not asShape) #inMemory)
         if asFileName:
             self._closeDataSource(bufferDatasource)
             return fileName
         return self._features2Json(bufferLayer)
 
+    def _getBufferCache(self):
+        cacheSize = self._configValue("BufferCacheSize")
+        if not cacheSize or cacheSize <= 0:
+            return None
+        if self._bufferCache is None:
+            self._bufferCache = BufferCache(self.getTempFilePath("bufferCache"), cacheSize * 1024 * 1024)
+        return self._bufferCache
+
+    def _createCachedBuffer(self, bufferCache, bufferDistance, side, asFileName):
+        if self._inputLayerHash is None:
+            self._inputLayerHash = BufferCache.layerHash(self._inputLayer)
+        key = BufferCache.key(self._inputLayerHash, bufferDistance, side)
+        cachedFile = bufferCache.lookup(key)
+        bufferDatasource = None
+        if cachedFile is not None and not asFileName:
+            # Another job may evict the file after the lookup, then it is a cache miss
+            bufferDatasource = BufferCache.openDataSource(cachedFile)
+            if bufferDatasource is None:
+                cachedFile = None
+        if cachedFile is not None:
+            self._print("SingleSided Buffer at Distance {0} on {1} Side found in cache.". format(
+                bufferDistance, AttributeCalculation.SIDES[side]), logging.INFO)
+        else:
+            geometries = self._createSingleSidedBufferGeometries(bufferDistance, side)
+            if geometries is None:
+                return None
+            cachedFile = bufferCache.store(key, geometries, self._inputLayer.GetSpatialRef())
+            if not asFileName:
+                bufferDatasource = BufferCache.openDataSource(cachedFile)
+        if asFileName:
+            return cachedFile
+        return self._features2Json(bufferDatasource.GetLayer() if bufferDatasource is not None else None)
+
     def _createSingleSidedBufferLayer(self, bufferDataSource, distance, side, asJson):
         self._print("Creating SingleSided Buffer at Distance {0} on {1} Side...". format(distance, AttributeCalculation.SIDES[side]), logging.INFO)
         try:
             total = self._inputLayer.GetFeatureCount()
-            sql = "select ID, ST_SingleSidedBuffer(geometry, %.2f , %i) from %s" % (distance, side, self._inputLayer.GetName())
-            resultLayer = self._inputDataSource.ExecuteSQL(sql, dialect='SQLite')
+            resultLayer = self._inputDataSource.ExecuteSQL(self._singleSidedBufferSQL(distance, side), dialect='SQLite')
             bufferLayer = bufferDataSource.CreateLayer('bufferLayer{0}'.format(AttributeCalculation.SIDES[side]), self._inputLayer.GetSpatialRef())
             self._createField(bufferLayer, AttributeCalculation.ID_ATTRIB, ogr.OFTInteger, 10, None)
         
@@ -247,33 +353,120 @@ class AttributeCalculation(BasicProcessing):
         finally:
             self._inputLayer.ResetReading()
             self._print("SingleSided Buffer created. {0} features processed, {1} failed.".format(total, total - processed), logging.INFO)
+
+    def _createSingleSidedBufferGeometries(self, distance, side):
+        self._print("Creating SingleSided Buffer Geometries at Distance {0} on {1} Side...". format(distance, AttributeCalculation.SIDES[side]), logging.INFO)
+        total = self._inputLayer.GetFeatureCount()
+        geometries = []
+        resultLayer = None
+        try:
+            resultLayer = self._inputDataSource.ExecuteSQL(self._singleSidedBufferSQL(distance, side), dialect='SQLite')
+            for feature in resultLayer:
+                geometry = feature.GetGeometryRef()
+                if geometry is not None:
+                    geometries.append((feature.GetField(AttributeCalculation.ID_ATTRIB), geometry.Clone()))
+            return geometries
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return None
+        finally:
+            if resultLayer is not None:
+                self._inputDataSource.ReleaseResultSet(resultLayer)
+            self._inputLayer.ResetReading()
+            self._print("SingleSided Buffer Geometries created. {0} features processed, {1} failed.".format(total, total - len(geometries)), logging.INFO)
+
+    def _singleSidedBufferSQL(self, distance, side):
+        return AttributeCalculation.singleSidedBufferSQL(self._inputLayer.GetName(), distance, side)
+
+    @staticmethod
+    def singleSidedBufferSQL(layerName, distance, side, fids = None):
+        sql = "select ID, ST_SingleSidedBuffer(geometry, %.2f , %i) from %s" % (distance, side, layerName)
+        if fids is not None:
+            # The SQLite dialect maps ROWID to the OGR feature ID, so the features are fetched by random access
+            sql += " where ROWID in (%s)" % ', '.join(str(int(fid)) for fid in fids)
+        return sql
     
     ### Zonal Stats
     
     def calculateZonalStats (self, rasterFileRGB, rasterFileDSM, leftBufferlayer = None, rightBufferlayer = None):
-        if self._inputLayer is None and self._prepareLayer(fileName, driverName) is None:
+        if self._inputLayer is None and self._prepareLayer(None) is None:
             return False
         layer = self._inputLayer
 
         # Create buffer layers
         distance = self._configValue("BufferDistance")
         if leftBufferlayer is None:
-            leftBufferlayer = self.createBuffer(distance, AttributeCalculation.LEFTSIDE)
+            leftBufferlayer = self.createBuffer(distance, AttributeCalculation.LEFTSIDE, None)
         if rightBufferlayer is None:
-            rightBufferlayer = self.createBuffer(distance, AttributeCalculation.RIGHTSIDE)
+            rightBufferlayer = self.createBuffer(distance, AttributeCalculation.RIGHTSIDE, None)
 
         statsMesaure = self._configValue("StatsMeasure")
+        try:
+            zonalStats = ZonalStatistics(statsMesaure, maxMemory=self._rasterWindowMemory(), 
+                                         medianTolerance=self._configValue("DSMMedianTolerance"))
+        except ValueError as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return False
+        for raster in self._zonalStatsRasters(rasterFileRGB, rasterFileDSM):
+            zonalStats.addRaster(*raster)
+
+        self._calculateZonalStats (layer, leftBufferlayer, rightBufferlayer, zonalStats)
+        layer.SyncToDisk()
+        return True
+
+    def calculateZonalStatsParallel (self, rasterFileRGB, rasterFileDSM, workers):
+        """
+        Calculates the zonal statistics in worker processes, each worker buffers a spatially coherent
+        chunk of lines, given by their feature IDs, and derives its gradients; the results are merged by ID.
+        """
+        if self._inputLayer is None and self._prepareLayer(None) is None:
+            return False
+        layer = self._inputLayer
+        rasters = self._zonalStatsRasters(rasterFileRGB, rasterFileDSM)
+        attributeNames = [name for fileName, bands, names in rasters for name in names]
+        if not attributeNames:
+            self._print("ZonalStats: No raster data available!", logging.ERROR)
+            return False
+
+        chunks = self._spatialChunks(layer, workers * AttributeCalculation.CHUNKS_PER_WORKER)
+        self._print("Calculating ZonalStats for attributes {0} with {1} workers in {2} chunks...".format(
+            ', '.join(attributeNames), workers, len(chunks)), logging.INFO)
+        tasks = [(self._inputFileName, layer.GetName(), chunk, self._configValue("BufferDistance"), 
+                  self._configValue("StatsMeasure"), rasters, self._rasterWindowMemory(), 
+                  self._configValue("DSMMedianTolerance")) for chunk in chunks]
+        leftStats = []
+        rightStats = []
+        try:
+            with multiprocessing.Pool(workers) as pool:
+                for i, (chunkLeftStats, chunkRightStats) in enumerate(pool.imap_unordered(_calculateZonalStatsChunk, tasks), start=1):
+                    leftStats.extend(chunkLeftStats)
+                    rightStats.extend(chunkRightStats)
+                    self._print("- chunk {0} of {1} calculated.".format(i, len(tasks)), logging.INFO)
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return False
+
+        if not leftStats or not rightStats:
+            self._print("ZonalStats: No data received!", logging.ERROR)
+            return False
+        self._setZonalStatsFields(layer, leftStats, rightStats, attributeNames)
+        layer.SyncToDisk()
+        self._print("ZonalStats calculated.", logging.INFO)
+        return True
+
+    def _zonalStatsRasters(self, rasterFileRGB, rasterFileDSM):
+        """
+        Returns the rasters for the zonal statistics as (file name, bands, attribute names) tuples.
+        """
+        rasters = []
         # RGB
         if not rasterFileRGB:
             rasterFileRGB = self._configValue("RGB_RasterFile")
         fileName = self.getInputFilePath(rasterFileRGB)
         if os.path.isfile(fileName):
-            self._calculateZonalStats (layer, leftBufferlayer, rightBufferlayer, fileName, 
-                                       'red_grad', AttributeCalculation.RED, statsMesaure)
-            self._calculateZonalStats (layer, leftBufferlayer, rightBufferlayer, fileName, 
-                                        'green_grad', AttributeCalculation.GREEN, statsMesaure)
-            self._calculateZonalStats (layer, leftBufferlayer, rightBufferlayer, fileName, 
-                                        'blue_grad', AttributeCalculation.BLUE, statsMesaure)
+            rasters.append((fileName, 
+                            [AttributeCalculation.RED, AttributeCalculation.GREEN, AttributeCalculation.BLUE], 
+                            ['red_grad', 'green_grad', 'blue_grad']))
         else:
             self._print("Raster file {0} does not exist!".format(fileName), logging.ERROR)
 
@@ -282,64 +475,157 @@ class AttributeCalculation(BasicProcessing):
             rasterFileDSM = self._configValue("DSM_RasterFile")
         fileName = self.getInputFilePath(rasterFileDSM)
         if os.path.isfile(fileName):
-            self._calculateZonalStats (layer, leftBufferlayer, rightBufferlayer, fileName, 
-                                        'dsm_grad', 1, statsMesaure)
+            rasters.append((fileName, [1], ['dsm_grad']))
         else:
             self._print("Raster file '{0}' does not exist!".format(fileName), logging.ERROR)
+        return rasters
 
-        layer.SyncToDisk()
-        return True
+    def _spatialChunks(self, layer, count):
+        """
+        Splits the OGR feature IDs (FIDs) of a layer into count chunks of neighbouring lines,
+        ordered along a Z-order curve of their envelope centers.
+        """
+        fids = []
+        centers = []
+        try:
+            for feature in layer:
+                geometry = feature.GetGeometryRef()
+                if geometry is not None:
+                    minX, maxX, minY, maxY = geometry.GetEnvelope()
+                    fids.append(feature.GetFID())
+                    centers.append(((minX + maxX) / 2, (minY + maxY) / 2))
+        finally:
+            layer.ResetReading()
+        if not fids:
+            return []
+        centers = np.array(centers)
+        extent = np.maximum(centers.max(axis=0) - centers.min(axis=0), 1e-9)
+        cells = ((centers - centers.min(axis=0)) / extent * 0xFFFF).astype(np.uint64)
+        order = np.argsort(AttributeCalculation._interleaveBits(cells[:, 0]) | (AttributeCalculation._interleaveBits(cells[:, 1]) << np.uint64(1)), kind='stable')
+        fids = np.array(fids)[order]
+        return [chunk.tolist() for chunk in np.array_split(fids, min(count, len(fids)))]
 
-    def _calculateZonalStats (self, layer, leftBufferlayer, rightBufferlayer, 
-                              rasterFileName, attributeName, colorBand, statsMeasure):
-        self._print("Calculating ZonalStats on raster '{0}' for attribute '{1}'...".format(os.path.basename(rasterFileName), attributeName), logging.INFO)
+    @staticmethod
+    def _interleaveBits(values):
+        """
+        Spreads the lower 16 bits of values to the even bit positions (Morton code).
+        """
+        values = values & np.uint64(0xFFFF)
+        values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF)
+        values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+        values = (values | (values << np.uint64(2))) & np.uint64(0x33333333)
+        values = (values | (values << np.uint64(1))) & np.uint64(0x55555555)
+        return values
+
+    def _calculateZonalStats (self, layer, leftBufferlayer, rightBufferlayer, zonalStats):
+        attributeNames = zonalStats.attributeNames()
+        if not attributeNames:
+            self._print("ZonalStats: No raster data available!", logging.ERROR)
+            return False
+        self._print("Calculating ZonalStats for attributes {0}...".format(', '.join(attributeNames)), logging.INFO)
         try:
-            leftStats = zonal_stats(leftBufferlayer, rasterFileName, band=colorBand, stats=statsMeasure, geojson_out=True, nodata=-999)
+            leftStats, rightStats = zonalStats.calculate(leftBufferlayer, rightBufferlayer)
         except Exception as e:
-            leftStats = []
+            leftStats, rightStats = [], []
             self._print("Error: {0}".format(str(e)), logging.ERROR)
+
+        if not leftStats or not rightStats:
+            self._print("ZonalStats: No data received!", logging.ERROR)
+            return False
+        self._setZonalStatsFields(layer, leftStats, rightStats, attributeNames)
+        self._print("ZonalStats calculated.", logging.INFO)
+        return True
+
+    def _setZonalStatsFields(self, layer, leftStats, rightStats, attributeNames):
         try:
-            rightStats = zonal_stats(rightBufferlayer, rasterFileName, band=colorBand, stats=statsMeasure, geojson_out=True, nodata=-999)
+            self._print("Populating fields '{0}' with {1} values...".format("', '".join(attributeNames), len(leftStats)), logging.INFO)
+            # Index the statistics by feature ID, left and right statistics are in the same order
+            statsIndex = {}
+            for leftFeature, rightFeature in zip(leftStats, rightStats):
+                leftProps = leftFeature['properties']
+                statsIndex[leftProps.get(AttributeCalculation.ID_ATTRIB)] = (leftProps, rightFeature['properties'])
+
+            # Gradient columns in feature order, features without statistics keep their values
+            featureStats = [statsIndex.get(featID) for featID in self._readFieldValues(layer, AttributeCalculation.ID_ATTRIB)]
+            calculated = dict.fromkeys(attributeNames, 0)
+            for attributeName in attributeNames:
+                gradients = []
+                for stats in featureStats:
+                    if stats is None:
+                        gradients.append(BasicProcessing.UNCHANGED)
+                        continue
+                    leftMeasure = stats[0].get(attributeName)
+                    rightMeasure = stats[1].get(attributeName)
+                    if leftMeasure is not None and rightMeasure is not None:
+                        gradients.append(abs(leftMeasure - rightMeasure))
+                        calculated[attributeName] += 1
+                    else:
+                        gradients.append(None)
+                self._queueLayerFields(layer, {attributeName: gradients})
+            self._flushLayerFields(layer)
+            total = len(featureStats)
+            for attributeName in attributeNames:
+                self._print("Field '%s' populated, %i of %i features have been attributed." % (attributeName, calculated[attributeName], total), logging.INFO)
         except Exception as e:
-            rightStats = []
             self._print("Error: {0}".format(str(e)), logging.ERROR)
 
+    ### Profile Sampling
+
+    def calculateProfileGradients(self, rasterFileRGB, rasterFileDSM):
+        """
+        Calculates the gradient attributes from profile samples left and right of each line instead of buffers.
+        """
+        if self._inputLayer is None and self._prepareLayer(None) is None:
+            return False
+        layer = self._inputLayer
+        leftStats, rightStats, attributeNames = self.gradientStats(rasterFileRGB, rasterFileDSM, AttributeCalculation.GRADIENT_PROFILE)
         if not leftStats or not rightStats:
-            self._print("ZonalStats: No data received!", logging.ERROR)
+            self._print("Profile Sampling: No data received!", logging.ERROR)
             return False
-        self._setZonalStatsField(layer, leftStats, rightStats, statsMeasure, attributeName)
-        self._print("ZonalStats calculated.", logging.INFO)
+        self._setZonalStatsFields(layer, leftStats, rightStats, attributeNames)
+        layer.SyncToDisk()
+        self._print("Profile Gradients calculated.", logging.INFO)
         return True
 
-    def _setZonalStatsField(self, layer, leftStats, rightStats, statsMeasure, attributeName):
+    def gradientStats(self, rasterFileRGB, rasterFileDSM, mode, vectorFileName = None):
+        """
+        Calculates the left and right statistics of all lines without writing them to the layer.
+        mode is GRADIENT_BUFFER (single sided buffers held in memory and created anew, never taken from the
+        buffer cache, so their time can be compared) or GRADIENT_PROFILE.
+        Returns leftStats, rightStats and the attribute names.
+        """
+        if self._inputLayer is None and self._prepareLayer(vectorFileName) is None:
+            return None, None, []
+        layer = self._inputLayer
+        statsMeasure = self._configValue("StatsMeasure")
         try:
-            self._print("Populating field '{0}' with {1} values...".format(attributeName, len(leftStats)), logging.INFO)
-            calculated = 0
-            failed = 0 
-            for i, feature in enumerate(layer):
-                featID = feature.GetField(AttributeCalculation.ID_ATTRIB)
-                for x in range(0, len(leftStats)):
-                    leftProps = leftStats[x]['properties']
-                    if leftProps.get(AttributeCalculation.ID_ATTRIB) == featID:
-                        leftMeasure = leftProps.get(statsMeasure)
-                        rightMeasure = rightStats[x]['properties'].get(statsMeasure)
-                        value = None
-                        if leftMeasure is not None and rightMeasure is not None:
-                            value = abs(leftMeasure - rightMeasure)
-                            calculated += 1
-                        else:
-                            failed += 1
-                        feature.SetField(attributeName, value)
-                        layer.SetFeature(feature)
-                        del leftStats[x]
-                        del rightStats[x]
-                        break
-            total = layer.GetFeatureCount()
-            self._print("Field '%s' populated, %i of %i features have been attributed." % (attributeName, calculated, total), logging.INFO)
+            if mode == AttributeCalculation.GRADIENT_PROFILE:
+                calculator = ProfileSampling(statsMeasure, self._configValue("BufferDistance"), self._configValue("ProfileSpacing"),
+                                             self._configValue("ProfileInterpolation") or ProfileSampling.NEAREST, 
+                                             maxMemory=self._rasterWindowMemory(), 
+                                             medianTolerance=self._configValue("DSMMedianTolerance"))
+            else:
+                calculator = ZonalStatistics(statsMeasure, maxMemory=self._rasterWindowMemory(), 
+                                             medianTolerance=self._configValue("DSMMedianTolerance"))
+        except ValueError as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return None, None, []
+        for raster in self._zonalStatsRasters(rasterFileRGB, rasterFileDSM):
+            calculator.addRaster(*raster)
+
+        self._print("Calculating {0} gradients for attributes {1}...".format(mode, ', '.join(calculator.attributeNames())), logging.INFO)
+        try:
+            if mode == AttributeCalculation.GRADIENT_PROFILE:
+                coordinates, offsets = self._readLineCoordinates(layer)
+                ids = self._readFieldValues(layer, AttributeCalculation.ID_ATTRIB)
+                leftStats, rightStats = calculator.calculate(ids, coordinates, offsets)
+            else:
+                leftBuffers, rightBuffers = self.createBuffers(None, None, asGeometries = True, useCache = False)
+                leftStats, rightStats = calculator.calculate(leftBuffers, rightBuffers)
         except Exception as e:
             self._print("Error: {0}".format(str(e)), logging.ERROR)
-        finally:
-            layer.ResetReading()
+            return None, None, []
+        return leftStats, rightStats, calculator.attributeNames()
 
     ### Run all processing functions
 
@@ -351,8 +637,24 @@ class AttributeCalculation(BasicProcessing):
                 return None
             self.calculateAttributes(None, None)
 
-            # Create buffer layers
-            leftBufferlayer, rightBufferlayer = self.createBuffers(None, None, inMemory = False, asShape = True, asFileName = True)
+            # Gradients from profile samples instead of buffers
+            if self._configValue("GradientMode") == AttributeCalculation.GRADIENT_PROFILE:
+                self.calculateProfileGradients(rasterFileRGB, rasterFileDSM)
+                self._print("*** Attribute Calculation finished.", logging.INFO)
+                return self._inputFileName
+
+            # Buffers and zonal stats of RGB and DSM in worker processes
+            workers = self._configValue("Workers")
+            if workers and workers > 1:
+                self.calculateZonalStatsParallel(rasterFileRGB, rasterFileDSM, workers)
+                self._print("*** Attribute Calculation finished.", logging.INFO)
+                return self._inputFileName
+
+            # Create buffer layers, either kept in memory or written to the temp directory
+            if self._configValue("BufferInMemory"):
+                leftBufferlayer, rightBufferlayer = self.createBuffers(None, None, asGeometries = True)
+            else:
+                leftBufferlayer, rightBufferlayer = self.createBuffers(None, None, inMemory = False, asShape = True, asFileName = True)
 
             # Zonal stats of RGB and DSM
             self.calculateZonalStats (rasterFileRGB, rasterFileDSM, leftBufferlayer, rightBufferlayer)
@@ -363,3 +665,29 @@ class AttributeCalculation(BasicProcessing):
         finally:
             self._closeAllDataSources()
 
+
+def _calculateZonalStatsChunk(task):
+    """
+    Worker process function of AttributeCalculation.calculateZonalStatsParallel:
+    buffers the lines of one chunk, given by their FIDs, on both sides and calculates their zonal statistics.
+    """
+    fileName, layerName, fids, distance, statsMeasure, rasters, maxMemory, medianTolerance = task
+    dataSource = ogr.Open(fileName, 0)
+    zonalStats = ZonalStatistics(statsMeasure, maxMemory=maxMemory, medianTolerance=medianTolerance)
+    for raster in rasters:
+        zonalStats.addRaster(*raster)
+    buffers = []
+    for side in (AttributeCalculation.LEFTSIDE, AttributeCalculation.RIGHTSIDE):
+        geometries = []
+        for start in range(0, len(fids), AttributeCalculation.FID_BATCH):
+            sql = AttributeCalculation.singleSidedBufferSQL(layerName, distance, side, fids[start:start + AttributeCalculation.FID_BATCH])
+            resultLayer = dataSource.ExecuteSQL(sql, dialect='SQLite')
+            for feature in resultLayer:
+                geometry = feature.GetGeometryRef()
+                if geometry is not None:
+                    geometries.append((feature.GetField(AttributeCalculation.ID_ATTRIB), geometry.Clone()))
+            dataSource.ReleaseResultSet(resultLayer)
+        buffers.append(geometries)
+    leftStats, rightStats = zonalStats.calculate(buffers[0], buffers[1])
+    dataSource = None
+    return leftStats, rightStats
@@ -32,6 +32,7 @@
  abstract base class for processing
 """
 
+import numpy as np
 from osgeo import ogr, gdal
 from sqlalchemy import MetaData, Table, Column, create_engine, select, update, insert
 from geoalchemy2.functions import ST_AsGeoJSON
@@ -43,6 +44,11 @@ import json
 from geojson import Feature, FeatureCollection, GeometryCollection
 from RequestController import RequestController
 from RestAPI import RestAPI
+try:
+    # Arrow batches keep NULL values apart, used by _readFieldColumns if available
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 STD_SRID = 4326
 STD_GEOMENCODING = 'GeoJSON'
@@ -58,6 +64,12 @@ class BasicProcessing():
     DRIVER_JSON = 'GeoJSON'
     DRIVER_MEM = 'MEMORY'
 
+    # Marks values of queued field columns which are left as they are
+    UNCHANGED = object()
+
+    # Number of features per batch of the Arrow stream in _readFieldColumns
+    ARROW_BATCH = 65536
+
     def __init__(self):
         self._basePath = os.path.split(__file__)[0]
         configFile = os.path.join(self._basePath, BasicProcessing.CONFIG_FILENAME)
@@ -67,6 +79,7 @@ class BasicProcessing():
         self._tempDataPath = self._configValue("TempDataPath")
         self._outputDataPath = self._configValue("OutputDataPath")
         self._dataSources = []
+        self._pendingFields = {}
         self._isLogging = False
         self._showConsoleLogging = self._configValue("ShowConsoleLogging") > 0
         self.startLogging(self.getTempFilePath(self._configValue("LogfileName")))
@@ -261,8 +274,18 @@ class BasicProcessing():
         layerDef = layer.GetLayerDefn()
         return layerDef.GetFieldDefn(index)
 
+    def _rasterWindowMemory(self):
+        """
+        Memory cap in bytes for raster windows read at once, configured in MB.
+        """
+        memory = self._configValue("RasterWindowMemory")
+        if memory:
+            return memory * 1024 * 1024
+        return None
+
     def _calculateLayer(self, layer, calcFuncs):
         if layer is not None:
+            transaction = self._startTransaction(layer)
             try:
                 i = 0
                 for feature in layer:
@@ -271,11 +294,173 @@ class BasicProcessing():
                         func(i, feature, geometry)
                     layer.SetFeature(feature)
                     i += 1 
+                self._commitTransaction(layer, transaction)
             except Exception as e:
+                self._rollbackTransaction(layer, transaction)
                 self._print("Error: {0}".format(str(e)), logging.ERROR)
             finally:
                 layer.ResetReading()
 
+    def _startTransaction(self, layer):
+        """
+        Starts a transaction if the layer supports them, so all feature updates are written at once on commit.
+        Returns whether a transaction was started.
+        """
+        if layer.TestCapability(ogr.OLCTransactions):
+            return layer.StartTransaction() == ogr.OGRERR_NONE
+        return False
+
+    def _commitTransaction(self, layer, transaction):
+        if transaction:
+            layer.CommitTransaction()
+
+    def _rollbackTransaction(self, layer, transaction):
+        if transaction:
+            layer.RollbackTransaction()
+
+    def _readLineCoordinates(self, layer, withParts = False):
+        """
+        Reads the vertices of all line features in one pass, the parts of multi-part lines one after another.
+        Returns an (n, 2) coordinate array and the offsets of the first vertex of each feature
+        (features + 1 entries, feature i owns coordinates[offsets[i]:offsets[i + 1]]);
+        withParts also the offsets of the first vertex of each part (parts + 1 entries).
+        """
+        coordinates = []
+        counts = []
+        partCounts = []
+        try:
+            for feature in layer:
+                count = 0
+                for part in BasicProcessing._lineParts(feature.GetGeometryRef()):
+                    points = part.GetPoints()
+                    if points:
+                        coordinates.extend(pt[:2] for pt in points)
+                        partCounts.append(len(points))
+                        count += len(points)
+                counts.append(count)
+        finally:
+            layer.ResetReading()
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        coordinates = np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+        if not withParts:
+            return coordinates, offsets
+        partOffsets = np.zeros(len(partCounts) + 1, dtype=np.int64)
+        np.cumsum(partCounts, out=partOffsets[1:])
+        return coordinates, offsets, partOffsets
+
+    @staticmethod
+    def _lineParts(geometry):
+        """
+        The line strings of a line or multi-part line geometry.
+        """
+        if geometry is None:
+            return []
+        if geometry.GetGeometryCount() > 0:
+            return [geometry.GetGeometryRef(i) for i in range(geometry.GetGeometryCount())]
+        return [geometry]
+
+    def _readFieldValues(self, layer, fieldName):
+        """
+        Reads the values of one field of all features in feature order.
+        """
+        index = layer.FindFieldIndex(fieldName, False)
+        try:
+            return [feature.GetField(index) for feature in layer]
+        finally:
+            layer.ResetReading()
+
+    def _readFieldColumns(self, layer, fieldNames):
+        """
+        Reads numeric fields of all features in feature order as float arrays, NULL as NaN; returns a dict
+        of field name and array. Only these fields are read, geometries and other fields are ignored.
+        The Arrow stream of the layer is read in batches where GDAL and pyarrow support it,
+        otherwise the features are read one by one.
+        """
+        layerDefn = layer.GetLayerDefn()
+        sourceNames = {}
+        for name in fieldNames:
+            index = layer.FindFieldIndex(name, False)
+            if index < 0:
+                raise ValueError("Field '{0}' not found in layer '{1}'".format(name, layer.GetName()))
+            sourceNames[name] = layerDefn.GetFieldDefn(index).GetName()
+        ignored = [layerDefn.GetFieldDefn(i).GetName() for i in range(layerDefn.GetFieldCount()) 
+                   if layerDefn.GetFieldDefn(i).GetName() not in sourceNames.values()]
+        layer.SetIgnoredFields(ignored + ['OGR_GEOMETRY', 'OGR_STYLE'])
+        try:
+            if pyarrow is not None and hasattr(layer, 'GetArrowStreamAsPyArrow'):
+                batches = {name: [] for name in fieldNames}
+                stream = layer.GetArrowStreamAsPyArrow(['INCLUDE_FID=NO', 'MAX_FEATURES_IN_BATCH={0}'.format(BasicProcessing.ARROW_BATCH)])
+                for batch in stream:
+                    for name in fieldNames:
+                        column = batch.column(sourceNames[name])
+                        values = np.asarray(column.to_numpy(zero_copy_only=False), dtype=np.float64)
+                        if column.null_count:
+                            values[np.asarray(column.is_null().to_numpy(zero_copy_only=False), dtype=bool)] = np.nan
+                        batches[name].append(values)
+                return {name: np.concatenate(values) if values else np.zeros(0) for name, values in batches.items()}
+            indices = [layer.FindFieldIndex(name, False) for name in fieldNames]
+            rows = [[feature.GetField(index) for index in indices] for feature in layer]
+            columns = np.array(rows, dtype=np.float64).reshape(-1, len(fieldNames))
+            return {name: columns[:, i] for i, name in enumerate(fieldNames)}
+        finally:
+            layer.SetIgnoredFields([])
+            layer.ResetReading()
+
+    def _setLayerFields(self, layer, fieldValues):
+        """
+        Writes columns of values in one pass, fieldValues maps field names to sequences in feature order.
+        None or NaN values are written as NULL.
+        """
+        if layer is None:
+            return False
+        self._queueLayerFields(layer, fieldValues)
+        return self._flushLayerFields(layer)
+
+    def _queueLayerFields(self, layer, fieldValues):
+        """
+        Adds columns of values in feature order to the pending updates of the layer, nothing is written
+        until _flushLayerFields. Values equal to UNCHANGED keep the current field value.
+        """
+        pendingLayer, columns = self._pendingFields.setdefault(id(layer), (layer, {}))
+        columns.update(fieldValues)
+
+    def _flushLayerFields(self, layer):
+        """
+        Writes all pending field updates of the layer in one pass, inside a transaction where supported.
+        Only the updated fields are written if GDAL provides Layer.UpdateFeature, so e.g. shapefile
+        geometries are not rewritten.
+        """
+        pendingLayer, columns = self._pendingFields.pop(id(layer), (layer, None))
+        if not columns:
+            return True
+        fieldIndices = [layer.FindFieldIndex(name, False) for name in columns]
+        columns = list(zip(fieldIndices, columns.values()))
+        partialUpdate = hasattr(layer, 'UpdateFeature')
+        transaction = self._startTransaction(layer)
+        try:
+            for i, feature in enumerate(layer):
+                for fieldIndex, values in columns:
+                    value = values[i]
+                    if value is BasicProcessing.UNCHANGED:
+                        continue
+                    if value is None or value != value:
+                        feature.SetField(fieldIndex, None)
+                    else:
+                        feature.SetField(fieldIndex, value.item() if isinstance(value, np.generic) else value)
+                if partialUpdate:
+                    layer.UpdateFeature(feature, fieldIndices, [], False)
+                else:
+                    layer.SetFeature(feature)
+            self._commitTransaction(layer, transaction)
+            return True
+        except Exception as e:
+            self._rollbackTransaction(layer, transaction)
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return False
+        finally:
+            layer.ResetReading()
+
     def _features2Json (self, layer):
         if layer is not None:
             if isinstance(layer, FeatureCollection):
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ benchmarks for choosing processing settings; the results are written as CSV files to the output directory.
+
+ sweepSegmentation:     runtime, peak memory, segment and boundary count and mean vertices per boundary of the
+                        segmentation and boundary extraction for each setting of the segmentation parameter grid
+ compareGradientModes:  runtime of the buffer and the profile gradient mode and the deviation of the
+                        profile gradients (mean absolute error, RMSE, correlation) from the buffer gradients
+"""
+
+# Import required modules
+import os
+import sys
+import csv
+import time
+import logging
+import itertools
+import multiprocessing
+import numpy as np
+from osgeo import ogr
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, no peak memory there
+    resource = None
+
+from BasicProcessing import BasicProcessing
+from AttributeCalculation import AttributeCalculation
+from Segmentation import Segmentation
+
+class Benchmark(BasicProcessing):
+
+    GRADIENT_FILENAME = 'gradient_benchmark.csv'
+    SEGMENTATION_FILENAME = 'segmentation_benchmark.csv'
+
+    # Arguments of the segmentation command varied by the sweep
+    SWEEP_ARGUMENTS = ('-algo', '-niter', '-region', '-blur')
+
+    def __init__(self):
+        super(Benchmark, self).__init__()
+
+    ### Segmentation Parameters
+
+    def sweepSegmentation(self, rasterFileNames):
+        """
+        Segments the rasters and extracts the boundaries for each setting of the configured parameter grid.
+        Each run has its own process, so the peak memory is measured per setting, and its own segment file;
+        failed runs are recorded with NaN counts.
+        """
+        if isinstance(rasterFileNames, str):
+            rasterFileNames = [rasterFileNames]
+        settings = Benchmark._sweepCommands(self._configValue("SegmantationCommand"), self._configValue("SegmentationSweep"))
+        tasks = [(self.getInputFilePath(fileName), command, index) for fileName in rasterFileNames for index, (setting, command) in enumerate(settings)]
+        labels = [setting for fileName in rasterFileNames for setting, command in settings]
+        self._print("Sweeping {0} segmentation settings over {1} rasters...".format(len(settings), len(rasterFileNames)), logging.INFO)
+        rows = []
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            for (rasterFileName, command, index), setting, result in zip(tasks, labels, pool.imap(_sweepRun, tasks)):
+                seconds, memory, segments, boundaries, vertices = result
+                rows.append([os.path.basename(rasterFileName), setting, round(seconds, 3), 
+                             memory, segments, boundaries, vertices])
+                self._print("- {0} {1}: {2:.2f} s, {3} MB, {4} segments, {5} boundaries, {6:.1f} vertices per boundary".format(*rows[-1]), logging.INFO)
+        finally:
+            pool.close()
+            pool.join()
+            # The settings measured so far are kept if the sweep is aborted
+            fileName = self.getOutputFilePath(Benchmark.SEGMENTATION_FILENAME)
+            Benchmark._writeCSV(fileName, ['raster', 'setting', 'seconds', 'peak_memory_mb', 'segments', 'boundaries', 'mean_vertices'], rows)
+            self._print("Segmentation benchmark written to '{0}'.".format(fileName), logging.INFO)
+        return fileName
+
+    @staticmethod
+    def _sweepCommands(command, grid):
+        """
+        Segmentation commands for all combinations of the grid values, a dict of argument name and value list;
+        arguments of the grid are removed from the configured command. -blur is added for true values.
+        Returns a list of (setting, command).
+        """
+        args = command.split()
+        base = []
+        i = 0
+        while i < len(args):
+            if args[i] in Benchmark.SWEEP_ARGUMENTS:
+                i += 1 if args[i] == '-blur' else 2
+            else:
+                base.append(args[i])
+                i += 1
+        names = [name for name in Benchmark.SWEEP_ARGUMENTS if name in grid]
+        commands = []
+        for values in itertools.product(*[grid[name] for name in names]):
+            setting = []
+            for name, value in zip(names, values):
+                if name == '-blur':
+                    setting += [name] if value else []
+                else:
+                    setting += [name, str(value)]
+            commands.append((' '.join(setting), ' '.join(base + setting)))
+        return commands
+
+    @staticmethod
+    def _peakMemory():
+        """
+        Peak resident memory in MB of this process and its finished child processes, e.g. gdal-segment.
+        """
+        if resource is None:
+            return np.nan
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # kB on Linux, bytes on macOS
+        return round(peak / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0), 1)
+
+    @staticmethod
+    def _lineStatistics(fileName):
+        """
+        Feature count of a vector file and the mean vertex count of its line features.
+        """
+        if not fileName:
+            return 0, np.nan
+        dataSource = ogr.Open(fileName)
+        if dataSource is None:
+            return 0, np.nan
+        layer = dataSource.GetLayer()
+        vertices = []
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            if geometry is not None and ogr.GT_Flatten(geometry.GetGeometryType()) == ogr.wkbLineString:
+                vertices.append(geometry.GetPointCount())
+        count = layer.GetFeatureCount()
+        layer = None
+        dataSource = None
+        return count, float(np.mean(vertices)) if vertices else np.nan
+
+    ### Gradient Modes
+
+    def compareGradientModes(self, rasterFileRGB, rasterFileDSM, vectorFileName):
+        self._print("Comparing gradient modes for '{0}'...".format(vectorFileName), logging.INFO)
+        process = AttributeCalculation()
+        if not process.calculateAttributes(vectorFileName):
+            process._closeAllDataSources()
+            return None
+
+        results = {}
+        try:
+            for mode in (AttributeCalculation.GRADIENT_BUFFER, AttributeCalculation.GRADIENT_PROFILE):
+                start = time.perf_counter()
+                leftStats, rightStats, attributeNames = process.gradientStats(rasterFileRGB, rasterFileDSM, mode)
+                seconds = time.perf_counter() - start
+                if not leftStats:
+                    self._print("No {0} gradients calculated!".format(mode), logging.ERROR)
+                    return None
+                results[mode] = (seconds, Benchmark._gradients(leftStats, rightStats, attributeNames))
+                self._print("- {0} mode: {1:.2f} s".format(mode, seconds), logging.INFO)
+        finally:
+            process._closeAllDataSources()
+
+        bufferSeconds, bufferGradients = results[AttributeCalculation.GRADIENT_BUFFER]
+        profileSeconds, profileGradients = results[AttributeCalculation.GRADIENT_PROFILE]
+        rows = []
+        for attributeName, reference in bufferGradients.items():
+            values = np.array([profileGradients[attributeName].get(featID, np.nan) for featID in reference], dtype=np.float64)
+            reference = np.array(list(reference.values()), dtype=np.float64)
+            valid = ~np.isnan(values) & ~np.isnan(reference)
+            deviation = values[valid] - reference[valid]
+            correlation = np.nan
+            if valid.sum() > 1 and np.std(values[valid]) > 0 and np.std(reference[valid]) > 0:
+                correlation = np.corrcoef(values[valid], reference[valid])[0, 1]
+            rows.append([attributeName, int(valid.sum()), round(bufferSeconds, 3), round(profileSeconds, 3),
+                         np.abs(deviation).mean() if valid.any() else np.nan,
+                         np.sqrt((deviation ** 2).mean()) if valid.any() else np.nan,
+                         correlation])
+            self._print("- {0}: MAE {1:.3f}, RMSE {2:.3f}, r {3:.3f} ({4} lines)".format(attributeName, rows[-1][4], rows[-1][5], correlation, rows[-1][1]), logging.INFO)
+
+        fileName = self.getOutputFilePath(Benchmark.GRADIENT_FILENAME)
+        Benchmark._writeCSV(fileName, ['attribute', 'lines', 'buffer_seconds', 'profile_seconds', 'mae', 'rmse', 'correlation'], rows)
+        self._print("Gradient benchmark written to '{0}'.".format(fileName), logging.INFO)
+        return fileName
+
+    @staticmethod
+    def _gradients(leftStats, rightStats, attributeNames):
+        """
+        Absolute left/right differences per attribute, keyed by feature ID.
+        """
+        gradients = {name: {} for name in attributeNames}
+        for leftFeature, rightFeature in zip(leftStats, rightStats):
+            leftProps = leftFeature['properties']
+            rightProps = rightFeature['properties']
+            featID = leftProps.get(AttributeCalculation.ID_ATTRIB)
+            for name in attributeNames:
+                if leftProps.get(name) is not None and rightProps.get(name) is not None:
+                    gradients[name][featID] = abs(leftProps[name] - rightProps[name])
+                else:
+                    gradients[name][featID] = np.nan
+        return gradients
+
+    @staticmethod
+    def _writeCSV(fileName, header, rows):
+        with open(fileName, 'w', newline='') as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def _sweepRun(task):
+    """
+    Worker process function of Benchmark.sweepSegmentation: segments the raster with the command and extracts
+    the boundaries into the segment file of the setting index. Returns seconds, peak memory in MB, segment count,
+    boundary count and mean vertices per boundary; the counts are NaN for a failed segmentation or extraction.
+    """
+    rasterFileName, command, index = task
+    start = time.perf_counter()
+    process = Segmentation()
+    segments = boundaries = vertices = np.nan
+    try:
+        # The segment files of the settings are written to the output path, never next to the input raster
+        outputFileName = process.getOutputFilePath("{0}_sweep{1}".format(os.path.basename(rasterFileName), index))
+        segmentFileName = process.createSegmentation(rasterFileName, command, outputFileName)
+        boundaryFileName = process.createBoundaries(segmentFileName) if segmentFileName else None
+        if segmentFileName:
+            segments = Benchmark._lineStatistics(segmentFileName)[0]
+        if boundaryFileName:
+            boundaries, vertices = Benchmark._lineStatistics(boundaryFileName)
+    except Exception as e:
+        process._print("Error: {0}".format(str(e)), logging.ERROR)
+        process._print("...on segmentation setting '{0}' of '{1}'!".format(command, rasterFileName), logging.ERROR)
+    finally:
+        process._closeAllDataSources()
+    seconds = time.perf_counter() - start
+    return seconds, Benchmark._peakMemory(), segments, boundaries, vertices
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ content addressed cache for single sided buffers.
+ Buffers are stored as GeoJson files named by a hash of the input geometries, the side and the distance,
+ the least recently used files are evicted when the cache exceeds its size limit.
+"""
+
+# Import required modules
+import os
+import hashlib
+from osgeo import ogr
+
+class BufferCache():
+
+    ID_ATTRIB = 'ID'
+    EXTENSION = '.json'
+
+    def __init__(self, directory, maxSize):
+        """
+        directory: cache directory, created if missing
+        maxSize: size limit of all cached files in bytes
+        """
+        self._directory = directory
+        self._maxSize = maxSize
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def layerHash(layer):
+        """
+        Hash of the IDs and geometries of all features of a layer.
+        """
+        digest = hashlib.sha1()
+        try:
+            for feature in layer:
+                digest.update(str(feature.GetField(BufferCache.ID_ATTRIB)).encode())
+                geometry = feature.GetGeometryRef()
+                if geometry is not None:
+                    digest.update(geometry.ExportToWkb())
+                digest.update(b';')
+        finally:
+            layer.ResetReading()
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(layerHash, distance, side):
+        return hashlib.sha1('{0}|{1!r}|{2}'.format(layerHash, float(distance), side).encode()).hexdigest()
+
+    def fileName(self, key):
+        return os.path.join(self._directory, key + BufferCache.EXTENSION)
+
+    def lookup(self, key):
+        """
+        Returns the file name of the cached buffer or None; a hit marks the file as recently used.
+        """
+        fileName = self.fileName(key)
+        if not os.path.isfile(fileName):
+            return None
+        try:
+            os.utime(fileName, None)
+        except OSError:
+            return None
+        return fileName
+
+    def store(self, key, geometries, spatialReference = None):
+        """
+        Writes a list of (ID, geometry) tuples to the cache and returns the file name.
+        The file is written under a temporary name first, so concurrent jobs never read partial buffers.
+        """
+        fileName = self.fileName(key)
+        tempFileName = '{0}.{1}.tmp'.format(fileName, os.getpid())
+        driver = ogr.GetDriverByName('GeoJSON')
+        dataSource = driver.CreateDataSource(tempFileName)
+        layer = dataSource.CreateLayer(key, spatialReference)
+        layer.CreateField(ogr.FieldDefn(BufferCache.ID_ATTRIB, ogr.OFTInteger))
+        layerDefn = layer.GetLayerDefn()
+        for featID, geometry in geometries:
+            feature = ogr.Feature(layerDefn)
+            feature.SetField(BufferCache.ID_ATTRIB, featID)
+            feature.SetGeometry(geometry)
+            layer.CreateFeature(feature)
+        layer = None
+        dataSource = None
+        os.replace(tempFileName, fileName)
+        self.evict(keep=fileName)
+        return fileName
+
+    @staticmethod
+    def openDataSource(fileName):
+        """
+        Opens a cached buffer file, None if it was evicted by another job meanwhile.
+        """
+        try:
+            return ogr.Open(fileName)
+        except RuntimeError:
+            return None
+
+    def evict(self, keep = None):
+        """
+        Removes the least recently used files until the cache fits into its size limit.
+        The file keep is never removed.
+        """
+        entries = []
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            if name.endswith(BufferCache.EXTENSION) and path != keep:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        totalSize = sum(entry[1] for entry in entries)
+        if keep is not None and os.path.isfile(keep):
+            totalSize += os.path.getsize(keep)
+        for mtime, size, path in sorted(entries):
+            if totalSize <= self._maxSize:
+                break
+            try:
+                os.remove(path)
+                totalSize -= size
+            except OSError:
+                pass
@@ -53,11 +53,11 @@ import numpy as np
 import os
 import logging
 from osgeo import ogr, gdal
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.externals import joblib
 
 from BasicProcessing import BasicProcessing
 from RestAPI import RestAPI
+from ModelRegistry import ModelRegistry
+from FlatForest import FlatForest
 
 class Classification(BasicProcessing):
 
@@ -66,8 +66,13 @@ class Classification(BasicProcessing):
     BOUNDARYLABEL = 'boundary'
     ATTRIBUTES = ['vertices', 'length', 'azimuth', 'sinuosity', 'red_grad', 'green_grad', 'blue_grad', 'dsm_grad']
 
+    FORMAT_JOBLIB = 'joblib'
+    # Loads fast without scikit-learn and shares the memory-mapped forest, but predicts slower than joblib
+    FORMAT_FLAT = 'flat'
+
     def __init__(self):
         super(Classification, self).__init__()
+        ModelRegistry.setSize(self._configValue("ClassifierCacheSize"))
 
     ### Training
 
@@ -89,42 +94,24 @@ class Classification(BasicProcessing):
     def _loadFields(self, datasource, layer, labelName, attributeList):
         self._print("Load field data from '{0}'...".format(layer.GetName()), logging.INFO)
         try:
-
-            # Copy datasource to memory, otherwise some fields in layer are set to None
-            driver = self._getMemoryDriver()
-            sqlDatasource = driver.CopyDataSource(datasource, 'sqlDatasource')
-
-            # Create arrays to store attribute table values
-            numberAttributes = len(attributeList)
-            numberSamples = layer.GetFeatureCount()
-            attributes = np.zeros([numberSamples, numberAttributes])
-            labels = np.zeros([numberSamples, 1])
-
-            # Get labels
-            sql = 'SELECT %s FROM %s' % (labelName, layer.GetName())
-            sqlLayer = sqlDatasource.ExecuteSQL(sql)
-            for i, feature in enumerate(sqlLayer):
-                labels[i] = feature.GetField(labelName)
-        
-            # Get attributes
-            sql = 'SELECT %s FROM %s' % (', '.join(attributeList), layer.GetName())
-            sqlLayer = sqlDatasource.ExecuteSQL(sql)
-            for i, feature in enumerate(sqlLayer):
-                for j in range(0, len(attributeList)):
-                    attributes[i][j] = feature.GetField(attributeList[j])
+            # Only the label and attribute columns are read, without copying the datasource
+            columns = self._readFieldColumns(layer, [labelName] + list(attributeList))
+            labels = columns[labelName].reshape(-1, 1)
+            attributes = np.column_stack([columns[name] for name in attributeList]).reshape(len(labels), len(attributeList))
 
             # Replace no data values
             NaNs = np.isnan(attributes)
             attributes[NaNs] = -1
 
-            self._print("{0} field data samples loaded.".format(numberSamples), logging.INFO)
+            self._print("{0} field data samples loaded.".format(len(labels)), logging.INFO)
             return attributes, labels
         finally:
-            sqlDatasource.Release()
             layer.ResetReading()
 
     def _createClassifier(self, trainingAttributes, trainingLabels):
         self._print("Creating Classifier Model...", logging.INFO)
+        # Imported here, so the prediction with flat forests starts without scikit-learn
+        from sklearn.ensemble import RandomForestClassifier
         classifierModel = RandomForestClassifier(n_estimators=100, n_jobs=-1)
         classifierModel.fit(trainingAttributes, trainingLabels[:, 0])
         self._print("Classifier Model created.", logging.INFO)
@@ -141,7 +128,11 @@ class Classification(BasicProcessing):
                 name = self._configValue("ClassifierFileName")
             self._print("Saving Classifier Model in file '{0}'...".format(name), logging.INFO)
             name = self.getOutputFilePath(name)
-            joblib.dump(classifier, name)
+            ModelRegistry.save(classifier, name)
+            if self._configValue("ClassifierFormat") == Classification.FORMAT_FLAT:
+                flatName = FlatForest.fileName(name)
+                FlatForest.fromClassifier(classifier).save(flatName)
+                self._print("Flat forest saved in '{0}'.".format(flatName), logging.INFO)
             return name
         self._print("No classifier to save!", logging.ERROR)
         return None
@@ -156,14 +147,18 @@ class Classification(BasicProcessing):
         if layer is not None:
             self._print("Classification for '{0}'...".format(layer.GetName()), logging.INFO)
         
-            validationAttributes, validationLabels = self._loadFields(datasource, layer, Classification.IDLABEL, Classification.ATTRIBUTES)
             if classifier is None:
                 if not classifierName:
                     classifierName = self._configValue("ClassifierFileName")
                 classifier = self._loadClassifier(classifierName)
             if classifier is not None:
-                predictedLabels = self._predictLabels(classifier, validationAttributes)
-                self._updateFeatureAttributes(predictedLabels, validationLabels, layer, Classification.IDLABEL, Classification.BOUNDARYLABEL, Classification.LENGTHLABEL)
+                batchSize = self._configValue("PredictionBatchSize")
+                if batchSize:
+                    self._applyClassifierInBatches(classifier, layer, int(batchSize))
+                else:
+                    validationAttributes, validationLabels = self._loadFields(datasource, layer, Classification.IDLABEL, Classification.ATTRIBUTES)
+                    predictedLabels = self._predictLabels(classifier, validationAttributes)
+                    self._updateFeatureAttributes(predictedLabels, validationLabels, layer, Classification.IDLABEL, Classification.BOUNDARYLABEL, Classification.LENGTHLABEL)
                 self._print("Layer classified.", logging.INFO)
                 return fileName
             self._print("No classifier loaded!", logging.ERROR)
@@ -173,32 +168,102 @@ class Classification(BasicProcessing):
         if RestAPI.serverConnected():
             return RestAPI.loadClassifier(name)
         name = self.getInputFilePath(name)
-        if os.path.isfile(name):
-            self._print("Load classifier from '{0}'...".format(name), logging.INFO)
-            return joblib.load(name)
+        if self._configValue("ClassifierFormat") == Classification.FORMAT_FLAT and os.path.isdir(FlatForest.fileName(name)):
+            name = FlatForest.fileName(name)
+        if os.path.exists(name):
+            if ModelRegistry.isLoaded(name):
+                self._print("Classifier '{0}' already loaded.".format(name), logging.INFO)
+            else:
+                self._print("Load classifier from '{0}'...".format(name), logging.INFO)
+            return ModelRegistry.load(name)
         self._print("Could not load classifier from '{0}'!".format(name), logging.ERROR)
         return None
 
     def _predictLabels(self, classifier, validationAttributes):
         self._print("Calculate prediction data...", logging.INFO)
-        return classifier.predict_proba(validationAttributes)[:, 0]
+        return Classification._boundaryProbabilities(classifier, validationAttributes)
+
+    @staticmethod
+    def _boundaryProbabilities(classifier, attributes):
+        if isinstance(classifier, FlatForest):
+            return classifier.predictProbability(attributes)
+        return classifier.predict_proba(attributes)[:, 0]
+
+    def _applyClassifierInBatches(self, classifier, layer, batchSize):
+        """
+        Streaming prediction: each batch of features is predicted and its boundary probabilities are written
+        before the next batch is read, so the memory doesn't grow with the layer size.
+        """
+        self._print("Predicting {0} features in batches of {1}...".format(layer.GetFeatureCount(), batchSize), logging.INFO)
+        attributeIndices = [layer.FindFieldIndex(name, False) for name in Classification.ATTRIBUTES]
+        lengthIndex = layer.FindFieldIndex(Classification.LENGTHLABEL, False)
+        boundaryIndex = layer.FindFieldIndex(Classification.BOUNDARYLABEL, False)
+        # Without Layer.UpdateFeature whole features are rewritten, so nothing may be ignored then
+        partialUpdate = hasattr(layer, 'UpdateFeature')
+        if partialUpdate:
+            layer.SetIgnoredFields(['OGR_GEOMETRY', 'OGR_STYLE'])
+        processed = 0
+        transaction = self._startTransaction(layer)
+        try:
+            features = []
+            for feature in layer:
+                features.append(feature)
+                if len(features) == batchSize:
+                    processed += self._predictBatch(classifier, layer, features, attributeIndices, lengthIndex, boundaryIndex, partialUpdate)
+                    features = []
+            if features:
+                processed += self._predictBatch(classifier, layer, features, attributeIndices, lengthIndex, boundaryIndex, partialUpdate)
+            self._commitTransaction(layer, transaction)
+        except Exception:
+            self._rollbackTransaction(layer, transaction)
+            raise
+        finally:
+            if partialUpdate:
+                layer.SetIgnoredFields([])
+            layer.ResetReading()
+        layer.SyncToDisk()
+        self._print("Feature attributes of {0} features updated.".format(processed), logging.INFO)
+
+    def _predictBatch(self, classifier, layer, features, attributeIndices, lengthIndex, boundaryIndex, partialUpdate):
+        attributes = np.array([[feature.GetField(index) for index in attributeIndices] for feature in features], dtype=np.float64)
+        # Replace no data values
+        attributes[np.isnan(attributes)] = -1
+        probabilities = Classification._boundaryProbabilities(classifier, attributes)
+        for feature, probability in zip(features, probabilities):
+            # Scale boundary probability by line length (probability * length)
+            featureLength = feature.GetField(lengthIndex)
+            feature.SetField(boundaryIndex, float(probability) * float(featureLength) if featureLength is not None else None)
+            if partialUpdate:
+                layer.UpdateFeature(feature, [boundaryIndex], [], False)
+            else:
+                layer.SetFeature(feature)
+        return len(features)
 
     def _updateFeatureAttributes(self, predictedLabels, validationLabels, layer, IDLabel, boundaryLabel, lengthLabel):
         self._print("Updating attributes of {0} features...".format(layer.GetFeatureCount()), logging.INFO)
-        for feature in layer:
-            featureID = feature.GetField(IDLabel)
-            featureLength = float(feature.GetField(lengthLabel))
-            bndFieldIndex = feature.GetFieldIndex(boundaryLabel)
-            for i in range(0, len(predictedLabels)):
-                # Match feature and according boundary probability via ID
-                if int(validationLabels[i]) == featureID:
-                    # Scale boundary probability by line length (probability * length)
-                    feature.SetField(bndFieldIndex, float(predictedLabels[i]) * featureLength)
-                    break
-            layer.SetFeature(feature)
-        layer.ResetReading()
+        validationIDs = np.asarray(validationLabels, dtype=np.float64).ravel()
+        if len(validationIDs) == 0:
+            self._print("No predictions to update!", logging.ERROR)
+            return
+        columns = self._readFieldColumns(layer, [IDLabel, lengthLabel])
+        featureIDs = columns[IDLabel]
+        if np.array_equal(featureIDs, validationIDs):
+            # Predictions in feature order, as loaded by _loadFields
+            rows = np.arange(len(featureIDs))
+            found = np.ones(len(featureIDs), dtype=bool)
+        else:
+            # Match feature and according boundary probability via ID, the first prediction of an ID counts
+            order = np.argsort(validationIDs, kind='stable')
+            rows = order[np.searchsorted(validationIDs[order], featureIDs).clip(0, len(order) - 1)]
+            found = validationIDs[rows] == featureIDs
+
+        # Scale boundary probability by line length (probability * length), features without prediction keep their value
+        probabilities = np.asarray(predictedLabels, dtype=np.float64)[rows] * columns[lengthLabel]
+        values = [float(value) if matched else BasicProcessing.UNCHANGED for value, matched in zip(probabilities, found)]
+        if not self._setLayerFields(layer, {boundaryLabel: values}):
+            raise RuntimeError("Boundary probabilities of layer '{0}' could not be written".format(layer.GetName()))
         layer.SyncToDisk()
-        self._print("Feature attributes updated.", logging.INFO)
+        self._print("Feature attributes updated, {0} of {1} features predicted.".format(int(found.sum()), len(featureIDs)), logging.INFO)
         
     ### Run all processing functions
 
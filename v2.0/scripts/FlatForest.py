@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ random forest flattened to contiguous node arrays for prediction without scikit-learn.
+ The nodes of all trees are concatenated: split feature, threshold, the left and right child and the
+ probability of the first class. Leaves are their own children, so a line which reached a leaf stays there.
+ The (tree, line) entries of all trees and lines descend together, one tree level per step.
+ The arrays are saved as .npy files of a directory and memory-mapped on loading, so processes
+ predicting with the same forest share one copy.
+ The flat format trades prediction throughput for startup time and memory: it gives the same probabilities
+ as scikit-learn and needs no scikit-learn import, but predicting with numpy steps over all entries is
+ about 3.5 times slower than RandomForestClassifier.predict_proba on one core.
+"""
+
+# Import required modules
+import os
+import shutil
+import numpy as np
+
+class FlatForest():
+
+    LEAF = -1
+
+    FILE_SUFFIX = "_flat"
+    ARRAYS = ('roots', 'features', 'thresholds', 'children', 'probabilities')
+
+    # (tree, line) entries descending at once in predictProbability
+    BATCH_ENTRIES = 1 << 22
+    # Descent steps between the removals of the entries which reached a leaf
+    COMPACT_STEPS = 4
+
+    def __init__(self, roots, features, thresholds, children, probabilities):
+        """
+        roots: node index of the root of each tree
+        features, thresholds: split of each node, x[feature] <= threshold descends to the left child;
+                              float32 thresholds rounded down, so float32 features compare as with the float64 thresholds
+        children: (nodes, 2) array of the left and right child, both the node itself at leaves
+        probabilities: probability of the first class at each node, used at leaves
+        """
+        self._roots = roots
+        self._features = features
+        self._thresholds = thresholds
+        self._children = children
+        self._probabilities = probabilities
+
+    @staticmethod
+    def fromClassifier(classifier):
+        """
+        Flattens a fitted RandomForestClassifier (or any ensemble of sklearn decision tree classifiers).
+        """
+        roots, features, thresholds, children, probabilities = [], [], [], [], []
+        offset = 0
+        for estimator in classifier.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(offset, offset + tree.node_count)
+            leaves = tree.children_left == FlatForest.LEAF
+            values = tree.value[:, 0, :]
+            roots.append(offset)
+            features.append(np.where(leaves, 0, tree.feature))
+            thresholds.append(np.where(leaves, 0.0, tree.threshold))
+            children.append(np.column_stack((np.where(leaves, nodes, tree.children_left + offset), 
+                                             np.where(leaves, nodes, tree.children_right + offset))))
+            probabilities.append(values[:, 0] / np.maximum(values.sum(axis=1), np.finfo(np.float64).tiny))
+            offset += tree.node_count
+        if offset >= np.iinfo(np.int32).max:
+            raise ValueError("Forest with {0} nodes is too large to be flattened".format(offset))
+        thresholds = np.concatenate(thresholds) if thresholds else np.zeros(0)
+        # sklearn compares float32 features with the float64 thresholds: x <= t equals x <= the largest float32 not above t
+        rounded = thresholds.astype(np.float32)
+        above = rounded > thresholds
+        rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+        return FlatForest(np.array(roots, dtype=np.int32), 
+                          np.concatenate(features).astype(np.int32) if features else np.zeros(0, dtype=np.int32), 
+                          rounded, 
+                          np.concatenate(children).astype(np.int32) if children else np.zeros((0, 2), dtype=np.int32), 
+                          np.concatenate(probabilities).astype(np.float64) if probabilities else np.zeros(0))
+
+    @staticmethod
+    def fileName(classifierFileName):
+        """
+        Directory of the flat forest kept next to the classifier file.
+        """
+        return os.path.splitext(classifierFileName)[0] + FlatForest.FILE_SUFFIX
+
+    def save(self, directory):
+        """
+        Saves the node arrays as .npy files; an existing directory is replaced, so its modification time changes.
+        """
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        for name in FlatForest.ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, '_' + name))
+        return directory
+
+    @staticmethod
+    def load(directory):
+        return FlatForest(*[np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in FlatForest.ARRAYS])
+
+    def treeCount(self):
+        return len(self._roots)
+
+    def nodeCount(self):
+        return len(self._features)
+
+    def predictProbability(self, attributes):
+        """
+        Probability of the first class per line, the mean over all trees like RandomForestClassifier.predict_proba.
+        """
+        attributes = np.asarray(attributes, dtype=np.float32)
+        result = np.zeros(len(attributes), dtype=np.float64)
+        if self.treeCount() == 0:
+            return result
+        batchSize = max(1, FlatForest.BATCH_ENTRIES // self.treeCount())
+        for start in range(0, len(attributes), batchSize):
+            batch = attributes[start:start + batchSize]
+            # Summed in tree order like sklearn
+            result[start:start + len(batch)] = self._descend(batch).sum(axis=0) / self.treeCount()
+        return result
+
+    def _descend(self, attributes):
+        """
+        Leaf probabilities of all lines in all trees as (trees, lines) array. The (tree, line) entries
+        start at the tree roots and descend one level per step; entries at leaves are removed every
+        COMPACT_STEPS steps, meanwhile they stay at their leaf.
+        """
+        lineCount = len(attributes)
+        features = np.asarray(self._features)
+        thresholds = np.asarray(self._thresholds)
+        children = np.asarray(self._children).ravel()
+        nodeIndices = np.arange(self.nodeCount(), dtype=np.int32)
+        leaves = children[0::2] == nodeIndices
+        # Feature f of line i at f * lines + i
+        values = np.ascontiguousarray(attributes.T).ravel()
+        offsets = features.astype(np.int64) * lineCount
+
+        nodes = np.repeat(np.asarray(self._roots), lineCount)
+        entries = np.flatnonzero(~leaves[nodes])
+        lines = entries % lineCount
+        current = nodes[entries]
+        step = 0
+        while len(entries):
+            goRight = values[offsets[current] + lines] > thresholds[current]
+            current = children[2 * current + goRight]
+            step += 1
+            if step % FlatForest.COMPACT_STEPS == 0:
+                nodes[entries] = current
+                descending = ~leaves[current]
+                entries = entries[descending]
+                lines = lines[descending]
+                current = current[descending]
+        return np.asarray(self._probabilities)[nodes].reshape(self.treeCount(), lineCount)
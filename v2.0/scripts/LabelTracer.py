@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ boundary lines of a label raster, traced along the pixel edges without polygonizing the segments.
+ Pixel edges between different labels are collected window by window and merged to straight runs; the runs
+ are chained through the vertices where exactly two runs of the same label pair meet, so there is one line
+ per connected part of the boundary between two labels, split at the junctions. The work is linear in the
+ raster size; label 0 and the nodata value of the label raster have no boundaries.
+"""
+
+# Import required modules
+import numpy as np
+from osgeo import gdal
+
+from RasterWindows import RasterWindows
+
+class LabelTracer():
+
+    NODATA = 0
+
+    # Memory per pixel of a window: the labels as int64 plus masks and run indices
+    BYTES_PER_PIXEL = 32
+
+    def __init__(self, maxMemory = None):
+        """
+        maxMemory: memory cap in bytes for the raster windows traced at once
+        """
+        self._maxMemory = maxMemory
+
+    def trace(self, labelFileName):
+        """
+        Traces the boundaries of the label raster. Returns a list of (label, neighbour label, (n, 2) coordinates)
+        in map coordinates, with the lower label first; closed boundaries end at their start point.
+        """
+        dataset = gdal.Open(labelFileName)
+        band = dataset.GetRasterBand(1)
+        nodata = band.GetNoDataValue()
+        windows = RasterWindows(dataset, [1], self._maxMemory, LabelTracer.BYTES_PER_PIXEL)
+        runs = [np.zeros((0, 6), dtype=np.int64)]
+        for xoff, yoff, xsize, ysize in windows.windows():
+            # One more column and row to reach the edges along the right and lower window border
+            width = min(xsize + 1, dataset.RasterXSize - xoff)
+            height = min(ysize + 1, dataset.RasterYSize - yoff)
+            labels = band.ReadAsArray(xoff, yoff, width, height).astype(np.int64)
+            if nodata is not None:
+                labels[labels == int(nodata)] = LabelTracer.NODATA
+            runs.append(LabelTracer._runs(labels[:ysize, :width - 1], labels[:ysize, 1:width], True, xoff, yoff))
+            runs.append(LabelTracer._runs(labels[:height - 1, :xsize], labels[1:height, :xsize], False, xoff, yoff))
+        runs = np.concatenate(runs)
+        lineRuns, lineVertices, offsets = LabelTracer._chain(runs, dataset.RasterXSize + 1)
+        lines = LabelTracer._coordinates(lineVertices, offsets, dataset.RasterXSize + 1, dataset.GetGeoTransform())
+        # All runs of a line have the label pair of its first run
+        return [(int(label), int(neighbour), line) for (label, neighbour), line in zip(runs[lineRuns, :2].tolist(), lines)]
+
+    @staticmethod
+    def _runs(first, second, vertical, xoff, yoff):
+        """
+        Runs of pixel edges between the labels first and second, the pixels right of or below first.
+        Returns a (n, 6) array of (label, neighbour label, start x, start y, end x, end y) in pixel vertex coordinates.
+        """
+        boundary = (first != second) & (first != LabelTracer.NODATA) & (second != LabelTracer.NODATA)
+        if vertical:
+            # Sorted by column, so the edges of a run are consecutive
+            cols, rows = np.nonzero(boundary.T)
+            along, across = rows, cols
+        else:
+            rows, cols = np.nonzero(boundary)
+            along, across = cols, rows
+        if len(rows) == 0:
+            return np.zeros((0, 6), dtype=np.int64)
+        labels = np.minimum(first[rows, cols], second[rows, cols])
+        neighbours = np.maximum(first[rows, cols], second[rows, cols])
+        starts = np.ones(len(rows), dtype=bool)
+        starts[1:] = ((across[1:] != across[:-1]) | (along[1:] != along[:-1] + 1) | 
+                      (labels[1:] != labels[:-1]) | (neighbours[1:] != neighbours[:-1]))
+        starts = np.flatnonzero(starts)
+        ends = np.append(starts[1:], len(rows)) - 1
+        if vertical:
+            x0 = x1 = cols[starts] + 1
+            y0, y1 = rows[starts], rows[ends] + 1
+        else:
+            x0, x1 = cols[starts], cols[ends] + 1
+            y0 = y1 = rows[starts] + 1
+        return np.column_stack((labels[starts], neighbours[starts], x0 + xoff, y0 + yoff, x1 + xoff, y1 + yoff)).astype(np.int64)
+
+    @staticmethod
+    def _chain(runs, stride):
+        """
+        Chains the runs through the vertices shared by exactly two runs of the same label pair.
+        Returns the first run of each line, the vertex IDs (y * stride + x) of all lines concatenated and the line offsets.
+        """
+        count = len(runs)
+        # Run end points: index i is the start and count + i the end of run i
+        vertices = np.concatenate((runs[:, 3] * stride + runs[:, 2], runs[:, 5] * stride + runs[:, 4]))
+        pairs = np.concatenate((runs[:, :2], runs[:, :2]))
+        order = np.argsort(vertices, kind='stable')
+        sortedVertices = vertices[order]
+        unique, first, degree = np.unique(sortedVertices, return_index=True, return_counts=True)
+        endA = order[first[degree == 2]]
+        endB = order[first[degree == 2] + 1]
+        samePair = np.all(pairs[endA] == pairs[endB], axis=1)
+        linked = np.full(2 * count, -1, dtype=np.int64)
+        linked[endA[samePair]] = endB[samePair]
+        linked[endB[samePair]] = endA[samePair]
+
+        linked = linked.tolist()
+        vertices = vertices.tolist()
+        visited = bytearray(count)
+        lineRuns = []
+        lineVertices = []
+        offsets = [0]
+
+        def follow(run, entry):
+            # Enters the run at its start (entry 0) or end (entry 1) and follows the links
+            lineRuns.append(run)
+            lineVertices.append(vertices[entry * count + run])
+            while True:
+                visited[run] = 1
+                exit = run if entry else count + run
+                lineVertices.append(vertices[exit])
+                following = linked[exit]
+                if following < 0 or visited[following % count]:
+                    break
+                run, entry = following % count, following // count
+            offsets.append(len(lineVertices))
+
+        # Open lines start at junctions or line ends, the remaining runs form closed rings
+        for end in range(2 * count):
+            if linked[end] < 0 and not visited[end % count]:
+                follow(end % count, end // count)
+        for run in range(count):
+            if not visited[run]:
+                follow(run, 0)
+        return np.array(lineRuns, dtype=np.int64), np.array(lineVertices, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+    @staticmethod
+    def _coordinates(lineVertices, offsets, stride, geoTransform):
+        """
+        Removes the vertices inside straight stretches and transforms the lines to map coordinates.
+        Returns the lines as list of (n, 2) coordinate arrays.
+        """
+        if len(offsets) < 2:
+            return []
+        cols = lineVertices % stride
+        rows = lineVertices // stride
+        inner = np.ones(len(lineVertices), dtype=bool)
+        inner[offsets[:-1]] = False
+        inner[offsets[1:] - 1] = False
+        inner = np.flatnonzero(inner)
+        keep = np.ones(len(lineVertices), dtype=bool)
+        keep[inner] = ~(((cols[inner - 1] == cols[inner]) & (cols[inner] == cols[inner + 1])) | 
+                        ((rows[inner - 1] == rows[inner]) & (rows[inner] == rows[inner + 1])))
+        originX, pixelWidth, rotX, originY, rotY, pixelHeight = geoTransform
+        x = originX + cols[keep] * pixelWidth + rows[keep] * rotX
+        y = originY + cols[keep] * rotY + rows[keep] * pixelHeight
+        bounds = np.cumsum(np.add.reduceat(keep, offsets[:-1]))[:-1]
+        return np.split(np.column_stack((x, y)), bounds)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ registry of the classifiers loaded in this process. Loaded classifiers are kept in a LRU cache keyed by
+ file path and modification time, so repeated classifications load a file only once and a changed file is
+ loaded again. Flat forests (directories of node arrays) are loaded without importing scikit-learn and
+ their arrays are memory-mapped read-only, so processes loading the same forest share its pages.
+ Pickled scikit-learn classifiers are copied into the memory of each process on loading.
+"""
+
+# Import required modules
+import os
+from collections import OrderedDict
+
+from FlatForest import FlatForest
+
+class ModelRegistry():
+
+    DEFAULT_SIZE = 4
+
+    _models = OrderedDict()
+    _size = DEFAULT_SIZE
+
+    @staticmethod
+    def setSize(size):
+        """
+        Maximum number of classifiers kept loaded, 0 disables the cache; DEFAULT_SIZE if size is not set or invalid.
+        """
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            size = ModelRegistry.DEFAULT_SIZE
+        ModelRegistry._size = max(0, size)
+        ModelRegistry._evict()
+
+    @staticmethod
+    def clear():
+        ModelRegistry._models.clear()
+
+    @staticmethod
+    def _key(fileName):
+        fileName = os.path.abspath(fileName)
+        return fileName, os.stat(fileName).st_mtime_ns
+
+    @staticmethod
+    def isLoaded(fileName):
+        return os.path.exists(fileName) and ModelRegistry._key(fileName) in ModelRegistry._models
+
+    @staticmethod
+    def load(fileName):
+        """
+        Classifier of the file, from the cache if the file is unchanged. The node arrays of a flat forest
+        directory are memory-mapped read-only; a pickled classifier is a private copy of this process.
+        """
+        key = ModelRegistry._key(fileName)
+        model = ModelRegistry._models.get(key)
+        if model is None and os.path.isdir(fileName):
+            model = FlatForest.load(fileName)
+        elif model is None:
+            # Imported here, so flat forests are predicted without loading scikit-learn
+            from sklearn.externals import joblib
+            model = joblib.load(fileName, mmap_mode='r')
+        ModelRegistry._store(key, model)
+        return model
+
+    @staticmethod
+    def save(model, fileName):
+        """
+        Saves the classifier uncompressed, which loads faster than a compressed file, and caches it.
+        """
+        from sklearn.externals import joblib
+        joblib.dump(model, fileName, compress=0)
+        ModelRegistry._store(ModelRegistry._key(fileName), model)
+        return fileName
+
+    @staticmethod
+    def _store(key, model):
+        """
+        Caches the model as most recently used; older versions of the file are dropped.
+        """
+        for cachedKey in [cachedKey for cachedKey in ModelRegistry._models if cachedKey[0] == key[0]]:
+            del ModelRegistry._models[cachedKey]
+        if ModelRegistry._size > 0:
+            ModelRegistry._models[key] = model
+            ModelRegistry._evict()
+
+    @staticmethod
+    def _evict():
+        while len(ModelRegistry._models) > ModelRegistry._size:
+            ModelRegistry._models.popitem(last=False)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ profile sampling as fast alternative to the buffer polygons of the zonal statistics.
+ Each line is sampled at a fixed spacing along its segments and at several offsets perpendicular to it
+ on both sides, covering the same strip as the single sided buffers. The raster values are looked up
+ vectorized (nearest or bilinear) and reduced per line and side with the configured statistics measure.
+"""
+
+# Import required modules
+import numpy as np
+from osgeo import gdal
+
+from RasterWindows import RasterWindows
+from ZonalStatistics import ZonalStatistics
+
+class ProfileSampling():
+
+    NEAREST = 'nearest'
+    BILINEAR = 'bilinear'
+
+    LEFTSIDE = 0
+    RIGHTSIDE = 1
+
+    # Maximum number of samples held in memory at once
+    SAMPLE_BATCH = 4000000
+
+    def __init__(self, statsMeasure, distance, spacing, interpolation = NEAREST, nodata = ZonalStatistics.NODATA, maxMemory = None, medianTolerance = None):
+        """
+        statsMeasure: one of ZonalStatistics.MEASURES
+        distance: width of the sampled strip on each side, like the buffer distance
+        spacing: distance between samples along and across the line
+        interpolation: NEAREST or BILINEAR
+        medianTolerance: bin width of approximate medians of float samples, see ZonalStatistics.groupedMeasure
+        """
+        if statsMeasure not in ZonalStatistics.MEASURES:
+            raise ValueError("Statistics measure '{0}' is not supported".format(statsMeasure))
+        if interpolation not in (ProfileSampling.NEAREST, ProfileSampling.BILINEAR):
+            raise ValueError("Interpolation '{0}' is not supported".format(interpolation))
+        self._statsMeasure = statsMeasure
+        self._spacing = float(spacing)
+        across = max(1, int(round(distance / self._spacing)))
+        self._offsets = (np.arange(across) + 0.5) * (distance / across)
+        self._interpolation = interpolation
+        self._nodata = nodata
+        self._maxMemory = maxMemory
+        self._medianTolerance = medianTolerance
+        self._rasters = []
+
+    def addRaster(self, fileName, bands, attributeNames):
+        """
+        Registers a raster file; the values of band bands[i] are stored in attribute attributeNames[i].
+        """
+        dataset = gdal.Open(fileName)
+        if dataset is None:
+            return False
+        self._rasters.append((dataset, list(bands), list(attributeNames)))
+        return True
+
+    def attributeNames(self):
+        names = []
+        for dataset, bands, attributeNames in self._rasters:
+            names.extend(attributeNames)
+        return names
+
+    def calculate(self, ids, coordinates, offsets):
+        """
+        Calculates the statistics measure of all registered bands left and right of the lines given by
+        the coordinate array and offsets of BasicProcessing._readLineCoordinates.
+        Returns two lists of features ({'properties': {ID, attribute: measure, ...}}) like ZonalStatistics.calculate.
+        """
+        lineCount = len(offsets) - 1
+        measures = {name: np.full((lineCount, 2), np.nan) for name in self.attributeNames()}
+        samplesPerLength = len(self._offsets) * 2 / self._spacing
+        lengths = np.zeros(lineCount)
+        segmentLengths = np.hypot(*np.diff(coordinates, axis=0).T) if len(coordinates) > 1 else np.zeros(0)
+        breaks = offsets[1:-1]
+        segmentLengths[breaks[(breaks > 0) & (breaks < len(coordinates))] - 1] = 0.0
+        cumulated = np.concatenate(([0.0], np.cumsum(segmentLengths)))
+        valid = np.diff(offsets) > 0
+        lengths[valid] = cumulated[offsets[1:][valid] - 1] - cumulated[offsets[:-1][valid]]
+
+        # Lines are processed in batches of a bounded number of samples
+        first = 0
+        while first < lineCount:
+            batchSamples = np.cumsum((lengths[first:] * samplesPerLength) + len(self._offsets) * 2)
+            last = first + max(1, int(np.searchsorted(batchSamples, ProfileSampling.SAMPLE_BATCH)))
+            last = min(last, lineCount)
+            self._calculateBatch(coordinates, offsets, first, last, measures)
+            first = last
+
+        leftStats = []
+        rightStats = []
+        for i, featID in enumerate(ids):
+            leftProps = {ZonalStatistics.ID_ATTRIB: featID}
+            rightProps = {ZonalStatistics.ID_ATTRIB: featID}
+            for name, values in measures.items():
+                leftProps[name] = None if np.isnan(values[i, ProfileSampling.LEFTSIDE]) else float(values[i, ProfileSampling.LEFTSIDE])
+                rightProps[name] = None if np.isnan(values[i, ProfileSampling.RIGHTSIDE]) else float(values[i, ProfileSampling.RIGHTSIDE])
+            leftStats.append({'properties': leftProps})
+            rightStats.append({'properties': rightProps})
+        return leftStats, rightStats
+
+    def _calculateBatch(self, coordinates, offsets, first, last, measures):
+        start, end = offsets[first], offsets[last]
+        lineIndex, x, y = self.samplePoints(coordinates[start:end], offsets[first:last + 1] - start)
+        if len(x) == 0:
+            return
+        zones = lineIndex[0] * 2 + lineIndex[1]
+        zoneCount = (last - first) * 2
+        for dataset, bands, attributeNames in self._rasters:
+            values, valid = self._sample(dataset, bands, x, y)
+            for bandValues, bandValid, attributeName in zip(values, valid, attributeNames):
+                result = ZonalStatistics.groupedMeasure(zones[bandValid], bandValues[bandValid], zoneCount, 
+                                                        self._statsMeasure, self._medianTolerance)
+                measures[attributeName][first:last] = result.reshape(-1, 2)
+
+    def samplePoints(self, coordinates, offsets):
+        """
+        Sample points of the lines, returns ((line index, side), x, y) with line indices relative to offsets.
+        """
+        if len(coordinates) < 2:
+            empty = np.zeros(0, dtype=np.int64)
+            return (empty, empty), np.zeros(0), np.zeros(0)
+
+        # Segments within lines
+        segmentLine = np.searchsorted(offsets, np.arange(len(coordinates) - 1), side='right') - 1
+        startPoints = coordinates[:-1]
+        deltas = coordinates[1:] - startPoints
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        inside = (np.arange(1, len(coordinates)) < offsets[segmentLine + 1]) & (lengths > 0)
+        segments = np.flatnonzero(inside)
+
+        # Samples along the segments, centered in intervals of the sample spacing
+        counts = np.maximum(1, np.ceil(lengths[segments] / self._spacing).astype(np.int64))
+        segmentIndex = np.repeat(segments, counts)
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        fraction = (step + 0.5) / np.repeat(counts, counts)
+        pointsX = startPoints[segmentIndex, 0] + fraction * deltas[segmentIndex, 0]
+        pointsY = startPoints[segmentIndex, 1] + fraction * deltas[segmentIndex, 1]
+        normalX = -deltas[segmentIndex, 1] / lengths[segmentIndex]
+        normalY = deltas[segmentIndex, 0] / lengths[segmentIndex]
+        line = segmentLine[segmentIndex]
+
+        # Offsets perpendicular to the segments, positive to the left
+        lineIndices = []
+        sides = []
+        sampleX = []
+        sampleY = []
+        for side, sign in ((ProfileSampling.LEFTSIDE, 1.0), (ProfileSampling.RIGHTSIDE, -1.0)):
+            for offset in self._offsets:
+                lineIndices.append(line)
+                sides.append(np.full(len(line), side, dtype=np.int64))
+                sampleX.append(pointsX + sign * offset * normalX)
+                sampleY.append(pointsY + sign * offset * normalY)
+        return (np.concatenate(lineIndices), np.concatenate(sides)), np.concatenate(sampleX), np.concatenate(sampleY)
+
+    def _sample(self, dataset, bands, x, y):
+        """
+        Looks up the raster values of the bands at the points (x, y) window by window.
+        Returns a (bands, points) array of values and one of valid flags, which are False for points outside
+        the raster or on nodata. Nearest samples keep the raster data type, so integer bands get histogram medians.
+        """
+        values = None
+        valid = np.zeros((len(bands), len(x)), dtype=bool)
+        windows = RasterWindows(dataset, bands, self._maxMemory)
+        originX, pixelWidth, rotX, originY, rotY, pixelHeight = dataset.GetGeoTransform()
+        fx = (x - originX) / pixelWidth
+        fy = (y - originY) / pixelHeight
+        cols = np.floor(fx).astype(np.int64)
+        rows = np.floor(fy).astype(np.int64)
+        for windowIndex, items in windows.groupByWindow(cols, rows):
+            if self._interpolation == ProfileSampling.NEAREST:
+                itemCols = cols[items]
+                itemRows = rows[items]
+                x0, y0 = itemCols.min(), itemRows.min()
+                data = windows.read((int(x0), int(y0), int(itemCols.max() - x0 + 1), int(itemRows.max() - y0 + 1)))
+                samples = data[:, itemRows - y0, itemCols - x0]
+                invalid = (samples == self._nodata)
+                if samples.dtype.kind == 'f':
+                    invalid |= np.isnan(samples)
+            else:
+                # Bilinear interpolation between the four surrounding pixel centers, clamped at the raster border
+                gx = np.clip(fx[items] - 0.5, 0, dataset.RasterXSize - 1)
+                gy = np.clip(fy[items] - 0.5, 0, dataset.RasterYSize - 1)
+                c0 = np.minimum(np.floor(gx).astype(np.int64), dataset.RasterXSize - 2).clip(0)
+                r0 = np.minimum(np.floor(gy).astype(np.int64), dataset.RasterYSize - 2).clip(0)
+                c1 = np.minimum(c0 + 1, dataset.RasterXSize - 1)
+                r1 = np.minimum(r0 + 1, dataset.RasterYSize - 1)
+                wx = gx - c0
+                wy = gy - r0
+                x0, y0 = c0.min(), r0.min()
+                data = windows.read((int(x0), int(y0), int(c1.max() - x0 + 1), int(r1.max() - y0 + 1)))
+                corners = [data[:, r - y0, c - x0] for r, c in ((r0, c0), (r0, c1), (r1, c0), (r1, c1))]
+                invalid = np.any([corner == self._nodata for corner in corners], axis=0)
+                corners = [corner.astype(np.float64) for corner in corners]
+                samples = (corners[0] * (1 - wx) * (1 - wy) + corners[1] * wx * (1 - wy) +
+                           corners[2] * (1 - wx) * wy + corners[3] * wx * wy)
+                invalid |= np.isnan(samples)
+            if values is None:
+                values = np.zeros((len(bands), len(x)), dtype=samples.dtype)
+            values[:, items] = samples
+            valid[:, items] = ~invalid
+        if values is None:
+            values = np.zeros((len(bands), len(x)))
+        return values, valid
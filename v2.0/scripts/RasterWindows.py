@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ tiled access to rasters which do not fit into memory.
+ The raster is divided into windows aligned to its block structure, the window size is limited by a
+ memory cap for all bands read together. Features are grouped by the window they touch, so each window
+ is read only once and peak memory depends on the window size, not on the image size.
+"""
+
+# Import required modules
+import math
+import numpy as np
+from osgeo import gdal
+
+class RasterWindows():
+
+    DEFAULT_MEMORY = 256 * 1024 * 1024
+
+    def __init__(self, dataset, bands = None, maxMemory = None, bytesPerPixel = None):
+        """
+        dataset: GDAL raster dataset
+        bands: band numbers which are read together, all bands by default
+        maxMemory: memory cap in bytes for one window of all bands
+        bytesPerPixel: memory per pixel if further rasters of the same grid are read along, by default
+                       the size of the bands of dataset
+        """
+        self._dataset = dataset
+        self._bands = list(bands) if bands else list(range(1, dataset.RasterCount + 1))
+        if not maxMemory or maxMemory <= 0:
+            maxMemory = RasterWindows.DEFAULT_MEMORY
+        if not bytesPerPixel:
+            bytesPerPixel = RasterWindows.bytesPerPixel(dataset, self._bands)
+        blockX, blockY = dataset.GetRasterBand(self._bands[0]).GetBlockSize()
+        blockX = min(blockX, dataset.RasterXSize)
+        blockY = min(blockY, dataset.RasterYSize)
+        blocksAcross = int(math.ceil(dataset.RasterXSize / float(blockX)))
+        blocks = max(1, int(maxMemory // (max(bytesPerPixel, 1) * blockX * blockY)))
+        countX = max(1, min(blocksAcross, int(math.sqrt(blocks))))
+        countY = max(1, blocks // countX)
+        self._windowX = countX * blockX
+        self._windowY = countY * blockY
+        self._columns = int(math.ceil(dataset.RasterXSize / float(self._windowX)))
+        self._rows = int(math.ceil(dataset.RasterYSize / float(self._windowY)))
+
+    @staticmethod
+    def bytesPerPixel(dataset, bands):
+        return sum(gdal.GetDataTypeSize(dataset.GetRasterBand(band).DataType) // 8 for band in bands)
+
+    def windowSize(self):
+        return self._windowX, self._windowY
+
+    def count(self):
+        return self._columns * self._rows
+
+    def window(self, index):
+        """
+        Pixel window (xoff, yoff, xsize, ysize) of the window with the given index.
+        """
+        col = index % self._columns
+        row = index // self._columns
+        xoff = col * self._windowX
+        yoff = row * self._windowY
+        return xoff, yoff, min(self._windowX, self._dataset.RasterXSize - xoff), min(self._windowY, self._dataset.RasterYSize - yoff)
+
+    def windows(self):
+        for index in range(self.count()):
+            yield self.window(index)
+
+    def windowIndex(self, cols, rows):
+        """
+        Indices of the windows containing the pixels (cols, rows), -1 for pixels outside the raster.
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        inside = (cols >= 0) & (cols < self._dataset.RasterXSize) & (rows >= 0) & (rows < self._dataset.RasterYSize)
+        return np.where(inside, (rows // self._windowY) * self._columns + cols // self._windowX, -1)
+
+    def pixelCoordinates(self, x, y):
+        """
+        Column and row index of map coordinates.
+        """
+        originX, pixelWidth, rotX, originY, rotY, pixelHeight = self._dataset.GetGeoTransform()
+        cols = np.floor((np.asarray(x, dtype=np.float64) - originX) / pixelWidth).astype(np.int64)
+        rows = np.floor((np.asarray(y, dtype=np.float64) - originY) / pixelHeight).astype(np.int64)
+        return cols, rows
+
+    def groupByWindow(self, cols, rows):
+        """
+        Groups items by the window containing their pixel (cols[i], rows[i]).
+        Yields (window index, item indices) in window order; items outside the raster are skipped.
+        """
+        indices = self.windowIndex(cols, rows)
+        order = np.argsort(indices, kind='stable')
+        sortedIndices = indices[order]
+        bounds = np.flatnonzero(np.diff(sortedIndices)) + 1
+        for items in np.split(order, bounds):
+            if len(items) and indices[items[0]] >= 0:
+                yield int(indices[items[0]]), items
+
+    def read(self, window, bands = None):
+        """
+        Reads a pixel window of the given bands (all bands of this reader by default) as (bands, rows, cols) array.
+        The window may extend beyond the window grid, e.g. to cover features crossing window borders.
+        """
+        return RasterWindows.readWindow(self._dataset, window, bands or self._bands)
+
+    @staticmethod
+    def readWindow(dataset, window, bands):
+        xoff, yoff, xsize, ysize = window
+        return np.stack([dataset.GetRasterBand(band).ReadAsArray(xoff, yoff, xsize, ysize) for band in bands])
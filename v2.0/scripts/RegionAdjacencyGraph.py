@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ region adjacency graph of a segmentation: the segments with their IDs and statistics as nodes and the
+ boundary lines between adjacent segments, from which the edges are derived. The graph is saved as .npz
+ file next to the segment layer and is valid as long as the extraction mode, the segment ID field and the size
+ and modification time of its source files (segment layer, attribute table, label raster) are unchanged, so the
+ later stages load it instead of extracting the boundaries again.
+"""
+
+# Import required modules
+import os
+import numpy as np
+
+from Topology import Topology
+
+class RegionAdjacencyGraph():
+
+    FILE_SUFFIX = "_rag.npz"
+
+    def __init__(self, ids, values, linePolygons, lineNeighbours, lineOffsets, coordinates):
+        """
+        ids: segment IDs, the nodes are the indices into ids
+        values: (nodes, attributes) array of the segment statistics
+        linePolygons, lineNeighbours: node indices left and right of each boundary line
+        lineOffsets: start of each line in coordinates, lines + 1 entries
+        coordinates: (n, 2) array of the concatenated line coordinates
+        """
+        self._ids = np.asarray(ids)
+        self._values = np.asarray(values, dtype=np.float64)
+        self._linePolygons = np.asarray(linePolygons, dtype=np.int64)
+        self._lineNeighbours = np.asarray(lineNeighbours, dtype=np.int64)
+        self._lineOffsets = np.asarray(lineOffsets, dtype=np.int64)
+        self._coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self._adjacency = None
+
+    @staticmethod
+    def fromBoundaries(ids, values, boundaries):
+        """
+        Creates the graph from (node index, neighbour node index, (n, 2) coordinates) boundaries.
+        """
+        lengths = [len(boundary[2]) for boundary in boundaries]
+        lineOffsets = np.zeros(len(boundaries) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=lineOffsets[1:])
+        coordinates = np.concatenate([boundary[2] for boundary in boundaries]) if boundaries else np.zeros((0, 2))
+        return RegionAdjacencyGraph(ids, values, [boundary[0] for boundary in boundaries], [boundary[1] for boundary in boundaries], 
+                                    lineOffsets, coordinates)
+
+    @staticmethod
+    def fileName(segmentFileName):
+        """
+        File name of the graph kept next to the segment layer.
+        """
+        return os.path.splitext(segmentFileName)[0] + RegionAdjacencyGraph.FILE_SUFFIX
+
+    @staticmethod
+    def _sourceState(sourceFileNames):
+        """
+        Size and modification time of each source file, -1 for files which do not exist.
+        """
+        state = []
+        for sourceFileName in sourceFileNames:
+            if os.path.isfile(sourceFileName):
+                status = os.stat(sourceFileName)
+                state.extend((status.st_size, status.st_mtime_ns))
+            else:
+                state.extend((-1, -1))
+        return np.array(state, dtype=np.int64)
+
+    def save(self, fileName, sourceFileNames, extraction, idField):
+        """
+        Saves the graph with the extraction mode, the ID field and the state of the files it was created from.
+        """
+        with open(fileName, 'wb') as graphFile:
+            np.savez(graphFile, ids=self._ids, values=self._values, linePolygons=self._linePolygons, 
+                     lineNeighbours=self._lineNeighbours, lineOffsets=self._lineOffsets, coordinates=self._coordinates, 
+                     source=RegionAdjacencyGraph._sourceState(sourceFileNames), extraction=np.array(extraction), 
+                     idField=np.array(idField))
+
+    @staticmethod
+    def load(fileName, sourceFileNames, extraction, idField):
+        """
+        Loads a saved graph, None if there is none, it was extracted otherwise or with another ID field or
+        one of the source files (the first is the segment layer file) was changed since.
+        """
+        if not os.path.isfile(fileName) or not os.path.isfile(sourceFileNames[0]):
+            return None
+        with np.load(fileName, allow_pickle=False) as data:
+            if 'extraction' not in data.files or str(data['extraction']) != extraction:
+                return None
+            if 'idField' not in data.files or str(data['idField']) != idField:
+                return None
+            if not np.array_equal(data['source'], RegionAdjacencyGraph._sourceState(sourceFileNames)):
+                return None
+            return RegionAdjacencyGraph(data['ids'], data['values'], data['linePolygons'], data['lineNeighbours'], 
+                                        data['lineOffsets'], data['coordinates'])
+
+    def ids(self):
+        return self._ids
+
+    def values(self):
+        return self._values
+
+    def nodeCount(self):
+        return len(self._ids)
+
+    def lineCount(self):
+        return len(self._linePolygons)
+
+    def lines(self):
+        """
+        Node indices left and right of each boundary line.
+        """
+        return self._linePolygons, self._lineNeighbours
+
+    def lineCoordinates(self, line):
+        return self._coordinates[self._lineOffsets[line]:self._lineOffsets[line + 1]]
+
+    def boundaries(self, selection = None):
+        """
+        Boundary lines as (node index, neighbour node index, (n, 2) coordinates), all or those selected by a mask or index array.
+        """
+        lines = np.arange(self.lineCount())
+        if selection is not None:
+            lines = lines[selection]
+        return [(int(self._linePolygons[line]), int(self._lineNeighbours[line]), self.lineCoordinates(line)) for line in lines]
+
+    def edges(self):
+        """
+        Adjacent node pairs, each once with the lower node index first, as two sorted index arrays.
+        """
+        pairs = np.column_stack((np.minimum(self._linePolygons, self._lineNeighbours), np.maximum(self._linePolygons, self._lineNeighbours)))
+        pairs = np.unique(pairs.reshape(-1, 2), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def merged(self, roots, values):
+        """
+        Graph of merged regions. roots maps each node to the root node of its region, values holds the statistics
+        of each region at its root. The regions get the ID of their root; the lines inside the regions are dropped
+        and the remaining lines between two regions are joined where no other boundary meets.
+        """
+        roots = np.asarray(roots, dtype=np.int64)
+        regions, nodes = np.unique(roots, return_inverse=True)
+        polygons = nodes[self._linePolygons]
+        neighbours = nodes[self._lineNeighbours]
+        outer = np.flatnonzero(polygons != neighbours)
+        keys = list(zip(np.minimum(polygons, neighbours)[outer].tolist(), np.maximum(polygons, neighbours)[outer].tolist()))
+        chains = Topology.chainLines([self.lineCoordinates(line) for line in outer], keys)
+        return RegionAdjacencyGraph.fromBoundaries(self._ids[regions], np.asarray(values)[regions], 
+                                                   [(polygon, neighbour, line) for (polygon, neighbour), line in chains])
+
+    def neighbours(self, node):
+        """
+        Node indices adjacent to a node.
+        """
+        offsets, indices = self._adjacencyLists()
+        return indices[offsets[node]:offsets[node + 1]]
+
+    def _adjacencyLists(self):
+        """
+        Adjacency of all nodes in compressed rows: the neighbours of node i are indices[offsets[i]:offsets[i + 1]].
+        """
+        if self._adjacency is None:
+            first, second = self.edges()
+            nodes = np.concatenate((first, second))
+            others = np.concatenate((second, first))
+            order = np.lexsort((others, nodes))
+            offsets = np.zeros(self.nodeCount() + 1, dtype=np.int64)
+            np.cumsum(np.bincount(nodes, minlength=self.nodeCount()), out=offsets[1:])
+            self._adjacency = (offsets, others[order])
+        return self._adjacency
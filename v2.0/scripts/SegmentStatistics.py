@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ per segment statistics as written by gdal-segment (AREA, AVERAGE_n, STDDEV_n) from a label raster and
+ the RGB raster. Both rasters are read window by window and reduced with labelled bincounts over dense
+ segment indices, so memory grows with the number of segments, not with the largest label, and any
+ segmentation which can be given as label raster can be used by the boundary filter.
+"""
+
+# Import required modules
+import os
+import numpy as np
+from osgeo import gdal
+
+from RasterWindows import RasterWindows
+
+class SegmentStatistics():
+
+    NODATA = 0
+
+    def __init__(self, maxMemory = None):
+        """
+        maxMemory: memory cap in bytes for the raster windows read at once
+        """
+        self._maxMemory = maxMemory
+
+    def calculate(self, labelFileName, rasterFileName, bands = None):
+        """
+        Statistics of the raster bands (the first three by default) per label; label 0 and the nodata value
+        of the label raster are skipped. Returns the labels, their pixel counts and (labels, bands) arrays
+        of the means and the standard deviations.
+        """
+        labelDataset = gdal.Open(labelFileName)
+        dataset = gdal.Open(rasterFileName)
+        if (labelDataset.RasterXSize, labelDataset.RasterYSize) != (dataset.RasterXSize, dataset.RasterYSize):
+            raise ValueError("Label raster '{0}' doesn't match the grid of '{1}'".format(labelFileName, rasterFileName))
+        if not bands:
+            bands = list(range(1, min(3, dataset.RasterCount) + 1))
+        labelBand = labelDataset.GetRasterBand(1)
+        nodata = labelBand.GetNoDataValue()
+        bytesPerPixel = RasterWindows.bytesPerPixel(labelDataset, [1]) + RasterWindows.bytesPerPixel(dataset, bands)
+        windows = RasterWindows(labelDataset, [1], self._maxMemory, bytesPerPixel)
+
+        # Accumulators per segment in the order the labels are found, labels may be sparse or large IDs
+        segments = np.zeros(0, dtype=np.int64)
+        counts = np.zeros(0, dtype=np.int64)
+        sums = np.zeros((len(bands), 0))
+        squares = np.zeros((len(bands), 0))
+        for window in windows.windows():
+            labels = labelBand.ReadAsArray(*window).ravel().astype(np.int64)
+            values = RasterWindows.readWindow(dataset, window, bands).reshape(len(bands), -1).astype(np.float64)
+            valid = labels != SegmentStatistics.NODATA
+            if nodata is not None:
+                valid &= labels != nodata
+            labels = labels[valid]
+            if len(labels) == 0:
+                continue
+
+            # Dense indices of the labels of the window, new labels are appended
+            windowSegments, inverse = np.unique(labels, return_inverse=True)
+            order = np.argsort(segments, kind='stable')
+            positions = np.minimum(np.searchsorted(segments[order], windowSegments), max(len(segments) - 1, 0))
+            found = (segments[order][positions] == windowSegments) if len(segments) else np.zeros(len(windowSegments), dtype=bool)
+            indices = np.empty(len(windowSegments), dtype=np.int64)
+            indices[found] = order[positions[found]]
+            added = int((~found).sum())
+            indices[~found] = len(segments) + np.arange(added)
+            if added:
+                segments = np.concatenate((segments, windowSegments[~found]))
+                counts = np.concatenate((counts, np.zeros(added, dtype=np.int64)))
+                sums = np.concatenate((sums, np.zeros((len(bands), added))), axis=1)
+                squares = np.concatenate((squares, np.zeros((len(bands), added))), axis=1)
+            dense = indices[inverse.ravel()]
+            size = len(segments)
+            counts += np.bincount(dense, minlength=size)
+            for i, bandValues in enumerate(values[:, valid]):
+                sums[i] += np.bincount(dense, weights=bandValues, minlength=size)
+                squares[i] += np.bincount(dense, weights=bandValues * bandValues, minlength=size)
+
+        order = np.argsort(segments, kind='stable')
+        means = sums[:, order] / counts[order]
+        variances = np.maximum(squares[:, order] / counts[order] - means * means, 0.0)
+        return segments[order], counts[order], means.T, np.sqrt(variances).T
+
+    @staticmethod
+    def rasterizeSegments(layer, idField, rasterFileName, labelFileName):
+        """
+        Burns the IDs of the segment polygons into a UInt32 label raster on the grid of the given raster,
+        for segmentations which are only available as polygons.
+        """
+        dataset = gdal.Open(rasterFileName)
+        driver = gdal.GetDriverByName('GTiff')
+        if os.path.isfile(labelFileName):
+            driver.Delete(labelFileName)
+        labelDataset = driver.Create(labelFileName, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_UInt32,
+                                     ['TILED=YES', 'COMPRESS=LZW', 'BIGTIFF=IF_SAFER'])
+        labelDataset.SetGeoTransform(dataset.GetGeoTransform())
+        labelDataset.SetProjection(dataset.GetProjection())
+        labelDataset.GetRasterBand(1).SetNoDataValue(SegmentStatistics.NODATA)
+        gdal.RasterizeLayer(labelDataset, [1], layer, options=['ATTRIBUTE={0}'.format(idField)])
+        layer.ResetReading()
+        labelDataset = None
+        return labelFileName
@@ -29,7 +29,8 @@
  S. Crommelinck, Reiner Borchert, 2018
 
 ### Description ###
- module for executing an external segmentation tool, which creates superpixel areas from raster files
+ module for executing an external segmentation tool or the in-process SLIC segmentation, which create
+ superpixel areas from raster files, and for extracting the boundaries between adjacent superpixels
 """
 
 # Import required modules
@@ -37,35 +38,138 @@ import os
 import math
 import json
 import logging
+import numpy as np
 from subprocess import call
 from osgeo import ogr, gdal
 from rasterstats import zonal_stats
 from geojson import Feature, FeatureCollection
 
 from BasicProcessing import BasicProcessing
+from Topology import Topology
+from SegmentStatistics import SegmentStatistics
+from LabelTracer import LabelTracer
+from RegionAdjacencyGraph import RegionAdjacencyGraph
+from UnionFind import UnionFind
 
 class Segmentation(BasicProcessing):
 
+    BACKEND_GDALSEGMENT = 'gdal-segment'
+    BACKEND_SLIC = 'slic'
+
+    EXTRACT_TOPOLOGY = 'topology'
+    EXTRACT_INDEX = 'index'
+    EXTRACT_SQL = 'sql'
+    EXTRACT_RASTER = 'raster'
+
+    SIMPLIFY_LINE = 'line'
+    SIMPLIFY_NETWORK = 'network'
+
+    SEGMENT_ATTRIBUTES = ['AREA', 'AVERAGE_1', 'AVERAGE_2', 'AVERAGE_3', 'STDDEV_1', 'STDDEV_2', 'STDDEV_3']
+
     def __init__(self):
         super(Segmentation, self).__init__()
         self._inputDataSource = None
         self._inputLayer = None
 
-    def createSegmentation (self, rasterFileName):
+    def createSegmentation (self, rasterFileName, command = None, outputFileName = None):
+        """
+        Segments the raster with the segmentation command of the configuration or the given command.
+        The segments are written to outputFileName + ".shp", by default next to the raster in the output path.
+        Returns the segment file name, None if the segmentation failed.
+        """
+        if not command:
+            command = self._configValue("SegmantationCommand")
         if rasterFileName:
             self._print("Starting segmentation for raster '{0}'...".format(rasterFileName), logging.INFO)
             inputFileName = self.getInputFilePath(rasterFileName)
-            outputFileName = self.getOutputFilePath(rasterFileName)
+            if not outputFileName:
+                outputFileName = self.getOutputFilePath(rasterFileName)
             if outputFileName:
+                if self._configValue("SegmentationBackend") == Segmentation.BACKEND_SLIC:
+                    return self._createSuperpixelSegmentation(inputFileName, outputFileName, command)
                 outputFileName += ".shp"
-                command = self._configValue("SegmantationCommand").format(inputFileName, outputFileName)
+                command = command.format(inputFileName, outputFileName)
                 self._print("- command: {0}".format(command), logging.INFO)
-                call(command)
+                status = call(command)
+                if status != 0:
+                    self._print("Segmentation failed with exit status {0}!".format(status), logging.ERROR)
+                    return None
                 self._print("Segmentation finished.", logging.INFO)
                 return outputFileName
         self._print("No files specified!", logging.ERROR)
         return None
 
+    def _createSuperpixelSegmentation(self, inputFileName, outputFileName, command):
+        """
+        Segments the raster in process with the parameters of the segmentation command, tile by tile.
+        """
+        try:
+            # Imported here, so scikit-image is only needed by the slic backend
+            from SuperpixelSegmentation import SuperpixelSegmentation
+            engine = SuperpixelSegmentation.fromCommand(command, 
+                                                        self._configValue("SegmentationTileSize"), self._configValue("Workers"), 
+                                                        self._configValue("SegmentationHalo"))
+            self._print("- {0} segmentation, iterations: {1}, region size: {2}, blur: {3}".format(*engine.parameters()), logging.INFO)
+            labelFileName = SuperpixelSegmentation.labelFileName(outputFileName)
+            for tile, tileCount, labelCount in engine.segment(inputFileName, labelFileName):
+                self._print("- tile {0} of {1} segmented, {2} segments.".format(tile, tileCount, labelCount), logging.INFO)
+            if engine.seamPixels() or engine.seamMerges():
+                self._print("- {0} pixels reassigned and {1} fragments merged along the tile seams.".format(engine.seamPixels(), engine.seamMerges()), logging.INFO)
+            if engine.seamSplits():
+                self._print("- {0} disconnected segment pieces relabeled.".format(engine.seamSplits()), logging.INFO)
+            outputFileName += ".shp"
+            count = SuperpixelSegmentation.polygonize(labelFileName, outputFileName, self._configValue("RawSegmentsIDField"))
+            self._print("Segmentation finished, {0} segments created.".format(count), logging.INFO)
+            self.addSegmentStatistics(outputFileName, inputFileName, labelFileName)
+            return outputFileName
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return None
+
+    def addSegmentStatistics(self, segmentFileName, rasterFileName, labelFileName = None):
+        """
+        Adds the fields AREA (pixels), AVERAGE_n and STDDEV_n of the RGB raster to the segment layer, as written by gdal-segment.
+        The label raster holds the segment IDs; if missing it is rasterized from the segment polygons.
+        """
+        segmentFileName = self.getInputFilePath(segmentFileName)
+        rasterFileName = self.getInputFilePath(rasterFileName)
+        datasource, layer = self._openVectorLayer(segmentFileName, None)
+        if layer is None:
+            return False
+        self._print("Calculating segment statistics for '{0}'...".format(layer.GetName()), logging.INFO)
+        try:
+            idField = self._configValue("RawSegmentsIDField")
+            if not labelFileName:
+                labelFileName = SegmentStatistics.rasterizeSegments(layer, idField, rasterFileName,
+                                                                    self.getTempFilePath(layer.GetName() + "_labels.tif"))
+            statistics = SegmentStatistics(self._rasterWindowMemory())
+            labels, areas, means, stdDevs = statistics.calculate(labelFileName, rasterFileName)
+            if len(labels) == 0:
+                self._print("No segments in label raster '{0}'!".format(labelFileName), logging.ERROR)
+                return False
+
+            # Columns in feature order, looked up by segment ID
+            ids = np.array([featID if featID is not None else -1 for featID in self._readFieldValues(layer, idField)], dtype=np.int64)
+            rows = np.searchsorted(labels, ids).clip(0, len(labels) - 1)
+            found = labels[rows] == ids
+            columns = {'AREA': np.where(found, areas[rows], np.nan)}
+            for band in range(means.shape[1]):
+                columns['AVERAGE_{0}'.format(band + 1)] = np.where(found, means[rows, band], np.nan)
+                columns['STDDEV_{0}'.format(band + 1)] = np.where(found, stdDevs[rows, band], np.nan)
+            self._createField(layer, 'AREA', ogr.OFTInteger, 10, None)
+            for name in columns:
+                if name != 'AREA':
+                    self._createField(layer, name, ogr.OFTReal, 12, 3)
+            self._setLayerFields(layer, columns)
+            layer.SyncToDisk()
+            self._print("Statistics of {0} of {1} segments calculated.".format(int(found.sum()), len(ids)), logging.INFO)
+            return True
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return False
+        finally:
+            self._closeDataSource(datasource)
+
     def createBoundaries(self, inputFileName, inMemory = False, asShape = True, asFileName = True):
         if not inputFileName:
             inputFileName = self._configValue("RawSegmentsShapeFile")
@@ -98,6 +202,332 @@ class Segmentation(BasicProcessing):
         return self._inputLayer
 
     def _populateBoundariesLayer(self, datasource, targetLayer):
+        extraction = self._configValue("BoundaryExtraction")
+        if extraction == Segmentation.EXTRACT_SQL:
+            return self._populateBoundariesBySQL(datasource, targetLayer)
+        if extraction == Segmentation.EXTRACT_INDEX:
+            return self._populateBoundariesByIndex(targetLayer)
+        return self._populateBoundariesFromGraph(targetLayer, extraction)
+
+    def _populateBoundariesFromGraph(self, targetLayer, extraction):
+        """
+        Writes the boundary lines of the region adjacency graph which exceed the tolerances.
+        """
+        processed = 0
+        try:
+            graph = self.regionAdjacencyGraph(extraction = extraction)
+            if graph is None:
+                return False
+            if self._configValue("MergeSimilarSegments"):
+                graph = self._mergeSimilarSegments(graph)
+            polygons, neighbours = graph.lines()
+            keep = self._exceedsTolerance(graph.values(), polygons, neighbours)
+            targetLayer.CreateFields(self._boundaryFields(self._configValue("RawSegmentsIDField")))
+            processed = self._writeBoundaries(targetLayer, graph.boundaries(keep), graph.ids(), graph.values())
+            return True
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return False
+        finally:
+            self._print("Boundaries with {0} features created.".format(processed), logging.INFO)
+
+    def regionAdjacencyGraph(self, inputFileName = None, extraction = EXTRACT_TOPOLOGY):
+        """
+        Region adjacency graph of the input segments. It is loaded from the graph file next to the segment layer
+        if that is up to date, otherwise extracted from the label raster (EXTRACT_RASTER) or the segment polygons
+        and saved for the next run.
+        """
+        if self._inputLayer is None and self._prepareLayer(inputFileName or self._configValue("RawSegmentsShapeFile")) is None:
+            return None
+        sourceFileName = self._inputDataSource.GetDescription()
+        graphFileName = RegionAdjacencyGraph.fileName(sourceFileName)
+        labelFileName = None
+        if extraction != Segmentation.EXTRACT_RASTER:
+            extraction = Segmentation.EXTRACT_TOPOLOGY
+        else:
+            # Label rasters are written by the slic backend, which needs scikit-image anyway
+            from SuperpixelSegmentation import SuperpixelSegmentation
+            labelFileName = SuperpixelSegmentation.labelFileName(sourceFileName)
+        if extraction == Segmentation.EXTRACT_RASTER and not os.path.isfile(labelFileName):
+            self._print("No label raster '{0}', boundaries are extracted from topology.".format(labelFileName), logging.INFO)
+            extraction = Segmentation.EXTRACT_TOPOLOGY
+        idField = self._configValue("RawSegmentsIDField")
+        # The segment statistics are kept in the attribute table, which addSegmentStatistics updates
+        sourceFileNames = [sourceFileName, os.path.splitext(sourceFileName)[0] + ".dbf"]
+        if extraction == Segmentation.EXTRACT_RASTER:
+            sourceFileNames.append(labelFileName)
+        try:
+            graph = RegionAdjacencyGraph.load(graphFileName, sourceFileNames, extraction, idField)
+            if graph is not None:
+                self._print("Region adjacency graph loaded from '{0}', {1} segments, {2} boundaries.".format(
+                            graphFileName, graph.nodeCount(), graph.lineCount()), logging.INFO)
+                return graph
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            self._print("...on loading the region adjacency graph '{0}'!".format(graphFileName), logging.ERROR)
+
+        try:
+            if extraction == Segmentation.EXTRACT_RASTER:
+                graph = self._graphByRaster(labelFileName)
+            else:
+                graph = self._graphByTopology()
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return None
+        finally:
+            self._inputLayer.ResetReading()
+        if os.path.isfile(sourceFileName):
+            try:
+                graph.save(graphFileName, sourceFileNames, extraction, idField)
+                self._print("Region adjacency graph saved to '{0}'.".format(graphFileName), logging.INFO)
+            except Exception as e:
+                self._print("Error: {0}".format(str(e)), logging.ERROR)
+                self._print("...on saving the region adjacency graph '{0}'!".format(graphFileName), logging.ERROR)
+        return graph
+
+    def _mergeSimilarSegments(self, graph):
+        """
+        Merges adjacent segments within the tolerances by union-find over the graph edges. The merged regions
+        get the summed area, the area weighted averages and the pooled standard deviations of their segments.
+        """
+        first, second = graph.edges()
+        values = graph.values()
+        similar = ~self._exceedsTolerance(values, first, second)
+        unionFind = UnionFind(graph.nodeCount())
+        merges = unionFind.unionPairs(first[similar], second[similar])
+        if merges == 0:
+            return graph
+        roots = unionFind.roots()
+
+        areas = values[:, 0]
+        weights = np.where(np.isnan(areas), 1.0, areas)
+        totals = np.bincount(roots, weights=weights, minlength=len(roots))
+        merged = np.full(values.shape, np.nan)
+        merged[:, 0] = np.bincount(roots, weights=areas, minlength=len(roots))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for band in range(3):
+                average, stdDev = values[:, 1 + band], values[:, 4 + band]
+                mean = np.bincount(roots, weights=weights * average, minlength=len(roots)) / totals
+                square = np.bincount(roots, weights=weights * (stdDev * stdDev + average * average), minlength=len(roots)) / totals
+                merged[:, 1 + band] = mean
+                merged[:, 4 + band] = np.sqrt(np.maximum(square - mean * mean, 0.0))
+        graph = graph.merged(roots, merged)
+        self._print("{0} segments merged into {1} regions, {2} boundaries left.".format(len(roots), graph.nodeCount(), graph.lineCount()), logging.INFO)
+        return graph
+
+    def _graphByTopology(self):
+        """
+        Extracts the boundaries from the shared ring edges of adjacent segments, in time linear to the vertex count.
+        """
+        self._print("Creating Boundaries from topology for '{0}'...".format(self._inputLayer.GetName()), logging.INFO)
+        ids, values, geometries = self._readSegments(self._configValue("RawSegmentsIDField"))
+        topology = Topology()
+        for i, geometry in enumerate(geometries):
+            topology.addPolygon(i, geometry)
+        geometries = None
+        boundaries = topology.sharedBoundaries(ids)
+        self._print("{0} shared boundaries found between {1} segments.".format(len(boundaries), len(ids)), logging.INFO)
+        return RegionAdjacencyGraph.fromBoundaries(ids, values, boundaries)
+
+    def _graphByRaster(self, labelFileName):
+        """
+        Extracts the boundaries by tracing the pixel edges of the label raster of the segmentation, without
+        reading the segment polygons; the label raster holds the segment IDs.
+        """
+        self._print("Creating Boundaries from label raster '{0}'...".format(labelFileName), logging.INFO)
+        ids, values, geometries = self._readSegments(self._configValue("RawSegmentsIDField"), withGeometries = False)
+        boundaries = LabelTracer(self._rasterWindowMemory()).trace(labelFileName)
+        self._print("{0} boundaries traced.".format(len(boundaries)), logging.INFO)
+        if len(ids) == 0:
+            return RegionAdjacencyGraph.fromBoundaries(ids, values, [])
+
+        # Segment indices of the labels, boundaries of labels missing in the segment layer are skipped
+        order = np.argsort(ids, kind='stable')
+        labels = np.array([boundary[0] for boundary in boundaries] + [boundary[1] for boundary in boundaries], dtype=np.int64)
+        rows = order[np.searchsorted(ids[order], labels).clip(0, len(ids) - 1)]
+        found = ids[rows] == labels
+        polygons, neighbours = rows[:len(boundaries)], rows[len(boundaries):]
+        keep = found[:len(boundaries)] & found[len(boundaries):]
+        if not keep.all():
+            self._print("{0} boundaries of labels missing in the segment layer skipped.".format(int((~keep).sum())), logging.INFO)
+        return RegionAdjacencyGraph.fromBoundaries(ids, values, [(polygon, neighbour, boundary[2]) for polygon, neighbour, boundary, kept 
+                                                                 in zip(polygons, neighbours, boundaries, keep) if kept])
+
+    def _populateBoundariesByIndex(self, targetLayer):
+        """
+        Extracts the boundaries by intersecting neighbouring segments, for segments which do not share their vertices.
+        Candidate pairs come from overlapping envelopes and are filtered by the tolerances before any geometry test.
+        """
+        self._print("Creating Boundaries from envelope index for '{0}'...".format(self._inputLayer.GetName()), logging.INFO)
+        processed = 0
+        failed = 0
+        try:
+            idField = self._configValue("RawSegmentsIDField")
+            ids, values, geometries = self._readSegments(idField)
+            envelopes = np.array([geometry.GetEnvelope() if geometry is not None and not geometry.IsEmpty() else (np.nan,) * 4 
+                                  for geometry in geometries], dtype=np.float64).reshape(-1, 4)
+            skipped = int((~np.isfinite(envelopes).all(axis=1)).sum())
+            if skipped:
+                self._print("{0} segments without geometry are skipped.".format(skipped), logging.INFO)
+            polygons, neighbours = Topology.envelopePairs(envelopes)
+
+            # Lower ID on the left like the self-join, the tolerance filter before any geometry work
+            swap = ids[polygons] > ids[neighbours]
+            polygons, neighbours = np.where(swap, neighbours, polygons), np.where(swap, polygons, neighbours)
+            candidates = (ids[polygons] != ids[neighbours]) & self._exceedsTolerance(values, polygons, neighbours)
+            self._print("{0} candidate pairs of {1} segments, {2} exceed the tolerances.".format(len(polygons), len(ids), int(candidates.sum())), logging.INFO)
+
+            boundaries = []
+            for polygon, neighbour in zip(polygons[candidates], neighbours[candidates]):
+                try:
+                    geometry = geometries[polygon]
+                    other = geometries[neighbour]
+                    if not geometry.Touches(other):
+                        continue
+                    lines = Segmentation._linearParts(geometry.Intersection(other))
+                    for line in Topology.chainLines(lines):
+                        boundaries.append((polygon, neighbour, line))
+                except Exception as e:
+                    self._print("Error: {0}".format(str(e)), logging.ERROR)
+                    self._print("...on boundary {0}/{1}!".format(ids[polygon], ids[neighbour]), logging.ERROR)
+                    failed += 1
+
+            targetLayer.CreateFields(self._boundaryFields(idField))
+            processed = self._writeBoundaries(targetLayer, boundaries, ids, values)
+            return True
+        except Exception as e:
+            self._print("Error: {0}".format(str(e)), logging.ERROR)
+            return False
+        finally:
+            self._inputLayer.ResetReading()
+            self._print("Boundaries with {0} features created, {1} failed.".format(processed, failed), logging.INFO)
+
+    @staticmethod
+    def _linearParts(geometry):
+        """
+        Coordinate arrays of all line strings in a geometry (collection), points are skipped.
+        """
+        if geometry is None:
+            return []
+        geometryType = ogr.GT_Flatten(geometry.GetGeometryType())
+        if geometryType == ogr.wkbLineString:
+            points = geometry.GetPoints()
+            return [np.array([pt[:2] for pt in points], dtype=np.float64)] if points and len(points) > 1 else []
+        parts = []
+        if geometryType in (ogr.wkbMultiLineString, ogr.wkbGeometryCollection):
+            for i in range(geometry.GetGeometryCount()):
+                parts.extend(Segmentation._linearParts(geometry.GetGeometryRef(i)))
+        return parts
+
+    def _readSegments(self, idField, withGeometries = True):
+        """
+        Reads the segments: IDs, the SEGMENT_ATTRIBUTES as (n, 7) array (NaN if missing) and the geometries
+        (None without withGeometries).
+        """
+        layer = self._inputLayer
+        layerDefn = layer.GetLayerDefn()
+        fieldIndices = [layerDefn.GetFieldIndex(name) for name in Segmentation.SEGMENT_ATTRIBUTES]
+        ids = []
+        values = []
+        geometries = []
+        try:
+            for feature in layer:
+                ids.append(feature.GetField(idField))
+                values.append([feature.GetField(index) if index >= 0 else None for index in fieldIndices])
+                if withGeometries:
+                    geometry = feature.GetGeometryRef()
+                    geometries.append(geometry.Clone() if geometry is not None else None)
+        finally:
+            layer.ResetReading()
+        values = np.array(values, dtype=np.float64).reshape(-1, len(Segmentation.SEGMENT_ATTRIBUTES))
+        return np.array(ids), values, geometries if withGeometries else None
+
+    def _exceedsTolerance(self, values, polygons, neighbours):
+        """
+        Boundary filter of the segment pairs: True where any average or standard deviation differs
+        by more than its tolerance, like the where clause of _populateBoundariesBySQL.
+        """
+        tolerances = np.array([self._configValue(name) for name in ("Tolerance_Average_R", "Tolerance_Average_G", "Tolerance_Average_B",
+                                                                    "Tolerance_StdDev_R", "Tolerance_StdDev_G", "Tolerance_StdDev_B")], dtype=np.float64)
+        differences = np.abs(values[polygons, 1:] - values[neighbours, 1:])
+        with np.errstate(invalid='ignore'):
+            exceeds = np.any(differences > tolerances, axis=1)
+        # Segments without statistics, e.g. not created by gdal-segment, can't be filtered
+        return exceeds | np.all(np.isnan(differences), axis=1)
+
+    def _boundaryFields(self, idField):
+        """
+        Field definitions of the boundary layer, the ID and attributes of the segments left and right.
+        """
+        layerDefn = self._inputLayer.GetLayerDefn()
+        fields = []
+        for side in ('LEFT', 'RIGHT'):
+            for sourceName, targetName in zip([idField] + Segmentation.SEGMENT_ATTRIBUTES, Segmentation._boundaryFieldNames(side)):
+                index = layerDefn.GetFieldIndex(sourceName)
+                if index >= 0:
+                    source = layerDefn.GetFieldDefn(index)
+                    fields.append(self._createField(None, targetName, source.GetType(), source.GetWidth(), source.GetPrecision()))
+                else:
+                    fields.append(self._createField(None, targetName, ogr.OFTReal, None, None))
+        return fields
+
+    @staticmethod
+    def _boundaryFieldNames(side):
+        suffix = side[0]
+        return ['ID_' + side, 'AREA_' + side, 
+                'AVERAGE1_' + suffix, 'AVERAGE2_' + suffix, 'AVERAGE3_' + suffix,
+                'STDDEV1_' + suffix, 'STDDEV2_' + suffix, 'STDDEV3_' + suffix]
+
+    @staticmethod
+    def _simplifyBoundaries(boundaries, tolerance):
+        """
+        Simplifies all boundary lines in one batch with their end points pinned, so the lines keep meeting at the junctions.
+        """
+        if not boundaries:
+            return boundaries
+        offsets = np.zeros(len(boundaries) + 1, dtype=np.int64)
+        np.cumsum([len(boundary[2]) for boundary in boundaries], out=offsets[1:])
+        coordinates = np.concatenate([boundary[2] for boundary in boundaries])
+        keep = Topology.simplifyLines(coordinates, offsets, tolerance)
+        bounds = np.cumsum(np.add.reduceat(keep, offsets[:-1]))[:-1]
+        return [(polygon, neighbour, line) for (polygon, neighbour, coordinates), line 
+                in zip(boundaries, np.split(coordinates[keep], bounds))]
+
+    def _writeBoundaries(self, targetLayer, boundaries, ids, values):
+        """
+        Writes (segment index, neighbour index, coordinates) boundaries as simplified lines with the attributes
+        of both segments. Returns the number of features written.
+        """
+        tolerance = self._configValue("RawSegmentsResolution")
+        if tolerance and self._configValue("BoundarySimplification") == Segmentation.SIMPLIFY_NETWORK:
+            boundaries = Segmentation._simplifyBoundaries(boundaries, tolerance)
+            tolerance = 0
+        layerDefn = targetLayer.GetLayerDefn()
+        fieldCount = len(Segmentation.SEGMENT_ATTRIBUTES) + 1
+        processed = 0
+        transaction = self._startTransaction(targetLayer)
+        try:
+            for polygon, neighbour, coordinates in boundaries:
+                feature = ogr.Feature(layerDefn)
+                for offset, segment in ((0, polygon), (fieldCount, neighbour)):
+                    featID = ids[segment]
+                    feature.SetField(offset, featID.item() if isinstance(featID, np.generic) else featID)
+                    for i, value in enumerate(values[segment], start=offset + 1):
+                        feature.SetField(i, None if np.isnan(value) else float(value))
+                line = ogr.Geometry(ogr.wkbLineString)
+                for x, y in coordinates:
+                    line.AddPoint_2D(float(x), float(y))
+                feature.SetGeometry(line.Simplify(tolerance) if tolerance else line)
+                targetLayer.CreateFeature(feature)
+                processed += 1
+            self._commitTransaction(targetLayer, transaction)
+        except Exception:
+            self._rollbackTransaction(targetLayer, transaction)
+            raise
+        targetLayer.SyncToDisk()
+        return processed
+
+    def _populateBoundariesBySQL(self, datasource, targetLayer):
         self._print("Creating Boundaries for '{0}'...".format(self._inputLayer.GetName()), logging.INFO)
         try:
             total = self._inputLayer.GetFeatureCount()
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ in-process SLIC/SLICO superpixel segmentation as replacement of the external gdal-segment tool.
+ The raster is segmented tile by tile, optionally in worker processes, into a label raster with unique
+ labels over all tiles; the label raster is polygonized into the segment layer.
+ With a halo each tile is segmented with a margin of the neighbouring tiles. A segment belongs to the tile
+ which contains most of its pixels and keeps its full extent across the seam, so the segments along the seams
+ have the same shape as in a whole image run and the tile borders don't create artificial straight boundaries.
+ Fragments of segments which are owned by neither tile are merged across the seam. A segment which the
+ claims along the seams leave in disconnected pieces keeps its label for the largest piece, the other pieces
+ get labels of their own, so every label is polygonized into one polygon.
+ The parameters follow gdal-segment: -algo <SLIC, SLICO>, -niter <iterations>, -region <pixels>, -blur.
+"""
+
+# Import required modules
+import os
+import multiprocessing
+import numpy as np
+from osgeo import ogr, gdal, osr
+from skimage.segmentation import slic
+from skimage.measure import label as connectedComponents
+
+from RasterWindows import RasterWindows
+from UnionFind import UnionFind
+
+class SuperpixelSegmentation():
+
+    SLIC = 'SLIC'
+    SLICO = 'SLICO'
+
+    NODATA = 0
+
+    # gdal-segment defaults
+    DEFAULT_ITERATIONS = 10
+    DEFAULT_REGION = 10
+    # Sigma of a 3x3 gaussian kernel as used by -blur
+    BLUR_SIGMA = 0.8
+    COMPACTNESS = 10.0
+
+    DEFAULT_TILESIZE = 2048
+
+    def __init__(self, algorithm = SLICO, iterations = DEFAULT_ITERATIONS, regionSize = DEFAULT_REGION, blur = False,
+                 tileSize = DEFAULT_TILESIZE, workers = 1, halo = 0):
+        """
+        algorithm: SLIC or SLICO (zero parameter SLIC with adaptive compactness)
+        iterations: number of k-means iterations
+        regionSize: average superpixel size in pixels
+        blur: smooth the image with a 3x3 gaussian kernel before segmenting
+        tileSize: edge length of the tiles segmented at once
+        workers: number of worker processes
+        halo: margin in pixels segmented along with each tile to stitch the segments across the seams, 0 to cut at the seams;
+              it should exceed the region size
+        """
+        algorithm = algorithm.upper()
+        if algorithm not in (SuperpixelSegmentation.SLIC, SuperpixelSegmentation.SLICO):
+            raise ValueError("Segmentation algorithm '{0}' is not supported".format(algorithm))
+        self._algorithm = algorithm
+        self._iterations = int(iterations)
+        self._regionSize = int(regionSize)
+        self._blur = blur
+        self._tileSize = int(tileSize or SuperpixelSegmentation.DEFAULT_TILESIZE)
+        self._workers = max(1, int(workers or 1))
+        self._halo = max(0, int(halo or 0))
+        self._seamPixels = 0
+        self._seamMerges = 0
+        self._seamSplits = 0
+
+    @staticmethod
+    def fromCommand(command, tileSize = DEFAULT_TILESIZE, workers = 1, halo = 0):
+        """
+        Creates a segmentation with the parameters of a gdal-segment command line.
+        """
+        args = command.split() if command else []
+        params = {}
+        for i, arg in enumerate(args):
+            value = args[i + 1] if i + 1 < len(args) else None
+            if arg == '-algo' and value:
+                params['algorithm'] = value
+            elif arg == '-niter' and value:
+                params['iterations'] = int(value)
+            elif arg == '-region' and value:
+                params['regionSize'] = int(value)
+            elif arg == '-blur':
+                params['blur'] = True
+        return SuperpixelSegmentation(tileSize=tileSize, workers=workers, halo=halo, **params)
+
+    def parameters(self):
+        return (self._algorithm, self._iterations, self._regionSize, self._blur)
+
+    def tiles(self, dataset):
+        """
+        Pixel windows (xoff, yoff, xsize, ysize) of the tiles in row order.
+        """
+        tiles = []
+        for yoff in range(0, dataset.RasterYSize, self._tileSize):
+            for xoff in range(0, dataset.RasterXSize, self._tileSize):
+                tiles.append((xoff, yoff, min(self._tileSize, dataset.RasterXSize - xoff), min(self._tileSize, dataset.RasterYSize - yoff)))
+        return tiles
+
+    def haloWindow(self, dataset, tile):
+        """
+        Window of a tile extended by the halo, clipped to the raster.
+        """
+        xoff, yoff, xsize, ysize = tile
+        x0, y0 = max(0, xoff - self._halo), max(0, yoff - self._halo)
+        x1, y1 = min(dataset.RasterXSize, xoff + xsize + self._halo), min(dataset.RasterYSize, yoff + ysize + self._halo)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def seamPixels(self):
+        """
+        Number of pixels assigned to segments of the neighbouring tile by the last segmentation.
+        """
+        return self._seamPixels
+
+    def seamMerges(self):
+        """
+        Number of segment fragments merged across tile seams by the last segmentation.
+        """
+        return self._seamMerges
+
+    def seamSplits(self):
+        """
+        Number of disconnected segment pieces relabeled by the last segmentation.
+        """
+        return self._seamSplits
+
+    def segment(self, rasterFileName, labelFileName):
+        """
+        Segments the first three bands of the raster into a UInt32 label raster, labels start at 1.
+        Yields (tile number, tile count, label count) after each tile.
+        """
+        dataset = gdal.Open(rasterFileName)
+        bands = list(range(1, min(3, dataset.RasterCount) + 1))
+        labelDataset = SuperpixelSegmentation._createLabelRaster(dataset, labelFileName)
+        labelBand = labelDataset.GetRasterBand(1)
+        tiles = self.tiles(dataset)
+        windows = [self.haloWindow(dataset, tile) for tile in tiles]
+        tasks = [(rasterFileName, window, bands, self.parameters()) for window in windows]
+        labelCount = 0
+        owned = np.zeros(1, dtype=bool)
+        unionFind = UnionFind()
+        rightHalos = {}
+        bottomHalos = {}
+        self._seamPixels = 0
+        self._seamMerges = 0
+        self._seamSplits = 0
+        pool = None
+        try:
+            if self._workers > 1 and len(tasks) > 1:
+                pool = multiprocessing.Pool(self._workers)
+                results = pool.imap(_segmentTile, tasks)
+            else:
+                results = map(_segmentTile, tasks)
+            for i, (tile, window, labels) in enumerate(zip(tiles, windows, results), start=1):
+                xoff, yoff, xsize, ysize = tile
+                coreX, coreY = xoff - window[0], yoff - window[1]
+                tileLabels = int(labels.max())
+                if self._halo > 0:
+                    owned = np.concatenate((owned, SuperpixelSegmentation._ownedSegments(labels, (coreX, coreY, xsize, ysize), tileLabels)))
+
+                # Labels are unique over all tiles
+                labels = np.where(labels > 0, labels + labelCount, SuperpixelSegmentation.NODATA).astype(np.uint32)
+                labelCount += tileLabels
+                core = labels[coreY:coreY + ysize, coreX:coreX + xsize]
+                if self._halo > 0:
+                    unionFind.resize(labelCount + 1)
+                    self._stitchTile(labelBand, tile, labels, coreX, coreY, rightHalos, bottomHalos, owned, unionFind)
+                labelBand.WriteArray(core, xoff, yoff)
+                yield i, len(tiles), labelCount
+
+            # Relabel the fragments merged across seams by the lowest label of each set
+            if self._seamMerges > 0:
+                roots = unionFind.roots().astype(np.uint32)
+                for xoff, yoff, xsize, ysize in tiles:
+                    labelBand.WriteArray(roots[labelBand.ReadAsArray(xoff, yoff, xsize, ysize)], xoff, yoff)
+            if self._halo > 0:
+                self._splitPieces(labelBand, tiles, labelCount)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            labelBand.FlushCache()
+            labelBand = None
+            labelDataset = None
+
+    @staticmethod
+    def _ownedSegments(labels, core, labelCount):
+        """
+        Flags of the segments 1..labelCount of a haloed tile which have at least half of their pixels in the tile core.
+        """
+        coreX, coreY, xsize, ysize = core
+        total = np.bincount(labels.ravel(), minlength=labelCount + 1)
+        inside = np.bincount(labels[coreY:coreY + ysize, coreX:coreX + xsize].ravel(), minlength=labelCount + 1)
+        return ((2 * inside >= total) & (total > 0))[1:]
+
+    def _stitchTile(self, labelBand, tile, labels, coreX, coreY, rightHalos, bottomHalos, owned, unionFind):
+        """
+        Reconciles the tile with its left and upper neighbours, whose halos overlap the tile core, and keeps
+        the own right and lower halo for the following tiles. The core is updated in place.
+        """
+        xoff, yoff, xsize, ysize = tile
+        core = labels[coreY:coreY + ysize, coreX:coreX + xsize]
+        strip = rightHalos.pop((xoff - self._tileSize, yoff), None)
+        if strip is not None:
+            width = min(strip.shape[1], xsize)
+            self._claimSeam(labelBand, strip[:, :width], core[:, :width], labels[coreY:coreY + ysize, :coreX], (xoff - coreX, yoff), owned)
+            self._mergeSeam(labelBand.ReadAsArray(xoff - 1, yoff, 1, ysize).ravel(), core[:, 0], owned, unionFind)
+        strip = bottomHalos.pop((xoff, yoff - self._tileSize), None)
+        if strip is not None:
+            height = min(strip.shape[0], ysize)
+            self._claimSeam(labelBand, strip[:height], core[:height], labels[:coreY, coreX:coreX + xsize], (xoff, yoff - coreY), owned)
+            self._mergeSeam(labelBand.ReadAsArray(xoff, yoff - 1, xsize, 1).ravel(), core[0], owned, unionFind)
+        if labels.shape[1] > coreX + xsize:
+            rightHalos[(xoff, yoff)] = labels[coreY:coreY + ysize, coreX + xsize:].copy()
+        if labels.shape[0] > coreY + ysize:
+            bottomHalos[(xoff, yoff)] = labels[coreY + ysize:, coreX:coreX + xsize].copy()
+
+    def _claimSeam(self, labelBand, neighbourLabels, coreStrip, haloLabels, haloOffset, owned):
+        """
+        Segments owned by the neighbour tile keep their pixels in this tile (neighbourLabels is the neighbour's
+        segmentation of coreStrip); segments owned by this tile take their pixels in the neighbour tile, which
+        is already written, unless these belong to segments owned by the neighbour.
+        """
+        claimed = owned[neighbourLabels]
+        coreStrip[claimed] = neighbourLabels[claimed]
+        self._seamPixels += int(claimed.sum())
+        if haloLabels.size:
+            x, y = haloOffset
+            current = labelBand.ReadAsArray(x, y, haloLabels.shape[1], haloLabels.shape[0])
+            claimed = owned[haloLabels] & ~owned[current]
+            if claimed.any():
+                current[claimed] = haloLabels[claimed]
+                labelBand.WriteArray(current, x, y)
+                self._seamPixels += int(claimed.sum())
+
+    def _mergeSeam(self, neighbourLabels, labels, owned, unionFind):
+        """
+        Merges the fragments facing each other across the seam which are owned by neither tile.
+        neighbourLabels and labels are the pixel rows or columns on both sides of the seam.
+        """
+        fragments = ~owned[neighbourLabels] & ~owned[labels] & (neighbourLabels > 0) & (labels > 0)
+        if fragments.any():
+            pairs = np.unique(np.column_stack((neighbourLabels[fragments], labels[fragments])), axis=0)
+            self._seamMerges += unionFind.unionPairs(pairs[:, 0], pairs[:, 1])
+
+    def _splitPieces(self, labelBand, tiles, labelCount):
+        """
+        Gives the disconnected pieces of a label their own labels, the largest piece keeps the label.
+        The 4-connected components of equal labels, as polygonized, are found tile by tile and joined
+        across the tile borders; a second pass writes the new labels.
+        """
+        unionFind = UnionFind(1)
+        componentLabels = [np.zeros(1, dtype=np.int64)]
+        componentSizes = [np.zeros(1, dtype=np.int64)]
+        rightEdges = {}
+        bottomEdges = {}
+        offsets = []
+        count = 0
+        for xoff, yoff, xsize, ysize in tiles:
+            labels, components = SuperpixelSegmentation._tileComponents(labelBand, (xoff, yoff, xsize, ysize), count)
+            pieces = int(components.max()) - count if components.any() else 0
+            offsets.append(count)
+            if pieces > 0:
+                local = components.ravel() - count
+                inside = local > 0
+                pieceLabels = np.zeros(pieces + 1, dtype=np.int64)
+                pieceLabels[local[inside]] = labels.ravel()[inside]
+                componentLabels.append(pieceLabels[1:])
+                componentSizes.append(np.bincount(local[inside], minlength=pieces + 1)[1:])
+                count += pieces
+                unionFind.resize(count + 1)
+
+            # Components with equal labels facing each other across a tile border are one piece
+            for edges, key, facingComponents, facingLabels in ((rightEdges, (xoff - self._tileSize, yoff), components[:, 0], labels[:, 0]), 
+                                                                (bottomEdges, (xoff, yoff - self._tileSize), components[0], labels[0])):
+                edge = edges.pop(key, None)
+                if edge is not None:
+                    length = min(len(edge[0]), len(facingLabels))
+                    joined = (edge[1][:length] == facingLabels[:length]) & (facingLabels[:length] != SuperpixelSegmentation.NODATA)
+                    if joined.any():
+                        pairs = np.unique(np.column_stack((edge[0][:length][joined], facingComponents[:length][joined])), axis=0)
+                        unionFind.unionPairs(pairs[:, 0], pairs[:, 1])
+            rightEdges[(xoff, yoff)] = (components[:, -1].copy(), labels[:, -1].copy())
+            bottomEdges[(xoff, yoff)] = (components[-1].copy(), labels[-1].copy())
+
+        # Pieces are the sets of joined components; of the pieces of a label the largest keeps it
+        roots = unionFind.roots()
+        componentLabels = np.concatenate(componentLabels)
+        pieceSizes = np.bincount(roots, weights=np.concatenate(componentSizes), minlength=count + 1)
+        pieces = np.flatnonzero(roots == np.arange(count + 1))[1:]
+        pieces = pieces[np.lexsort((-pieceSizes[pieces], componentLabels[pieces]))]
+        sortedLabels = componentLabels[pieces]
+        keeps = np.concatenate(([True], sortedLabels[1:] != sortedLabels[:-1])) if len(pieces) else np.zeros(0, dtype=bool)
+        self._seamSplits = int((~keeps).sum())
+        if self._seamSplits == 0:
+            return
+        newLabels = np.zeros(count + 1, dtype=np.int64)
+        newLabels[pieces] = sortedLabels
+        newLabels[pieces[~keeps]] = labelCount + 1 + np.arange(self._seamSplits)
+        newLabels = newLabels[roots].astype(np.uint32)
+        for tile, offset in zip(tiles, offsets):
+            labels, components = SuperpixelSegmentation._tileComponents(labelBand, tile, offset)
+            labelBand.WriteArray(newLabels[components], tile[0], tile[1])
+
+    @staticmethod
+    def _tileComponents(labelBand, tile, offset):
+        """
+        Labels of a tile and its 4-connected components of equal labels, numbered from offset + 1, 0 for no data.
+        """
+        xoff, yoff, xsize, ysize = tile
+        labels = labelBand.ReadAsArray(xoff, yoff, xsize, ysize)
+        components = connectedComponents(labels, background=SuperpixelSegmentation.NODATA, connectivity=1).astype(np.int64)
+        components[components > 0] += offset
+        return labels, components
+
+    @staticmethod
+    def labelFileName(segmentFileName):
+        """
+        File name of the label raster kept next to the segment layer.
+        """
+        return os.path.splitext(segmentFileName)[0] + "_labels.tif"
+
+    @staticmethod
+    def _createLabelRaster(dataset, labelFileName):
+        if os.path.isfile(labelFileName):
+            gdal.GetDriverByName('GTiff').Delete(labelFileName)
+        labelDataset = gdal.GetDriverByName('GTiff').Create(labelFileName, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_UInt32,
+                                                            ['TILED=YES', 'COMPRESS=LZW', 'BIGTIFF=IF_SAFER'])
+        labelDataset.SetGeoTransform(dataset.GetGeoTransform())
+        labelDataset.SetProjection(dataset.GetProjection())
+        labelDataset.GetRasterBand(1).SetNoDataValue(SuperpixelSegmentation.NODATA)
+        return labelDataset
+
+    @staticmethod
+    def polygonize(labelFileName, vectorFileName, idField, driverName = 'ESRI Shapefile'):
+        """
+        Converts the label raster to polygons with the label in field idField, label 0 is skipped.
+        """
+        labelDataset = gdal.Open(labelFileName)
+        labelBand = labelDataset.GetRasterBand(1)
+        driver = ogr.GetDriverByName(driverName)
+        if os.path.isfile(vectorFileName):
+            driver.DeleteDataSource(vectorFileName)
+        dataSource = driver.CreateDataSource(vectorFileName)
+        srs = None
+        if labelDataset.GetProjection():
+            srs = osr.SpatialReference()
+            srs.ImportFromWkt(labelDataset.GetProjection())
+        layer = dataSource.CreateLayer(os.path.splitext(os.path.basename(vectorFileName))[0], srs, ogr.wkbPolygon)
+        layer.CreateField(ogr.FieldDefn(idField, ogr.OFTInteger))
+        gdal.Polygonize(labelBand, labelBand, layer, 0, [], callback=None)
+        count = layer.GetFeatureCount()
+        layer = None
+        dataSource = None
+        return count
+
+
+def _segmentTile(task):
+    """
+    Worker process function of SuperpixelSegmentation.segment, returns the labels of one tile starting at 1.
+    """
+    fileName, window, bands, (algorithm, iterations, regionSize, blur) = task
+    dataset = gdal.Open(fileName)
+    image = np.moveaxis(RasterWindows.readWindow(dataset, window, bands), 0, -1)
+    dataset = None
+    segments = max(1, int(round(window[2] * window[3] / float(regionSize * regionSize))))
+    return slic(image, n_segments=segments, compactness=SuperpixelSegmentation.COMPACTNESS, max_num_iter=iterations,
+                sigma=SuperpixelSegmentation.BLUR_SIGMA if blur else 0, slic_zero=(algorithm == SuperpixelSegmentation.SLICO),
+                start_label=1, channel_axis=-1)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ shared edges of a polygon coverage, e.g. the superpixels of a segmentation.
+ Adjacent polygons of a coverage share their ring vertices exactly, so each ring edge occurs once in either
+ polygon. All ring edges are keyed by their end points and matched in one sorted pass; consecutive edges
+ of a ring with the same neighbour form one boundary line.
+ For polygons without common vertices envelopePairs finds the candidate neighbours in a uniform grid
+ over the envelopes, so only pairs with overlapping envelopes need a geometric test.
+"""
+
+# Import required modules
+import numpy as np
+from osgeo import ogr
+
+class Topology():
+
+    NO_NEIGHBOUR = -1
+
+    # Maximum number of candidate pairs tested at once in envelopePairs
+    PAIR_BATCH = 4000000
+
+    def __init__(self):
+        self._rings = []
+        self._ringPolygons = []
+
+    def addPolygon(self, polygonIndex, geometry):
+        """
+        Adds the rings of a polygon or multipolygon geometry, polygonIndex identifies the polygon in the results.
+        """
+        if geometry is None:
+            return
+        if ogr.GT_Flatten(geometry.GetGeometryType()) == ogr.wkbMultiPolygon:
+            polygons = [geometry.GetGeometryRef(i) for i in range(geometry.GetGeometryCount())]
+        else:
+            polygons = [geometry]
+        for polygon in polygons:
+            for i in range(polygon.GetGeometryCount()):
+                points = polygon.GetGeometryRef(i).GetPoints()
+                if points:
+                    self.addRing(polygonIndex, [pt[:2] for pt in points])
+
+    def addRing(self, polygonIndex, coordinates):
+        """
+        Adds a ring given as (n, 2) coordinate array, the closing point may be omitted.
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64)[:, :2]
+        if len(coordinates) > 1 and np.array_equal(coordinates[0], coordinates[-1]):
+            coordinates = coordinates[:-1]
+        if len(coordinates) >= 3:
+            self._rings.append(coordinates)
+            self._ringPolygons.append(polygonIndex)
+
+    def edgeNeighbours(self):
+        """
+        Matches all ring edges. Returns the concatenated ring coordinates, the ring offsets (rings + 1 entries),
+        the polygon of each edge and the polygon on the other side of each edge (NO_NEIGHBOUR on the outer border).
+        Edge i runs from coordinates[i] to the next vertex of its ring.
+        """
+        if not self._rings:
+            empty = np.zeros(0, dtype=np.int64)
+            return np.zeros((0, 2)), np.zeros(1, dtype=np.int64), empty, empty
+        coordinates = np.concatenate(self._rings)
+        ringLengths = np.array([len(ring) for ring in self._rings], dtype=np.int64)
+        ringOffsets = np.zeros(len(ringLengths) + 1, dtype=np.int64)
+        np.cumsum(ringLengths, out=ringOffsets[1:])
+        edgePolygons = np.repeat(np.array(self._ringPolygons, dtype=np.int64), ringLengths)
+        ends = Topology._nextVertices(ringOffsets)
+
+        # Undirected edge keys: the lexicographically smaller end point first
+        start = coordinates
+        end = coordinates[ends]
+        swap = (end[:, 0] < start[:, 0]) | ((end[:, 0] == start[:, 0]) & (end[:, 1] < start[:, 1]))
+        first = np.where(swap[:, None], end, start)
+        second = np.where(swap[:, None], start, end)
+
+        # Equal keys are adjacent after sorting, each pair is one shared edge
+        order = np.lexsort((second[:, 1], second[:, 0], first[:, 1], first[:, 0]))
+        keys = np.column_stack((first, second))[order]
+        equal = np.all(keys[1:] == keys[:-1], axis=1)
+        edgeA = order[:-1][equal]
+        edgeB = order[1:][equal]
+        neighbours = np.full(len(coordinates), Topology.NO_NEIGHBOUR, dtype=np.int64)
+        neighbours[edgeA] = edgePolygons[edgeB]
+        neighbours[edgeB] = edgePolygons[edgeA]
+        neighbours[neighbours == edgePolygons] = Topology.NO_NEIGHBOUR
+        return coordinates, ringOffsets, edgePolygons, neighbours
+
+    def sharedBoundaries(self, polygonOrder = None):
+        """
+        Chains the shared edges to boundary lines.
+        Returns a list of (polygon, neighbour, (n, 2) coordinates); each line is reported once, from the
+        polygon with the lower polygonOrder value (the polygon index by default) in its ring direction.
+        A pair of polygons gets one line per connected part of their common boundary.
+        """
+        coordinates, ringOffsets, edgePolygons, neighbours = self.edgeNeighbours()
+        if len(coordinates) == 0:
+            return []
+        ends = Topology._nextVertices(ringOffsets)
+        edgeCount = len(coordinates)
+        edgeRings = np.repeat(np.arange(len(ringOffsets) - 1), np.diff(ringOffsets))
+
+        # A new run starts at each ring start and where the neighbour changes along the ring
+        breaks = np.ones(edgeCount, dtype=bool)
+        breaks[1:] = neighbours[1:] != neighbours[:-1]
+        breaks[ringOffsets[:-1]] = True
+        runStarts = np.flatnonzero(breaks)
+        runEnds = np.append(runStarts[1:], edgeCount)
+        ringFirstRun = np.searchsorted(runStarts, ringOffsets[:-1])
+
+        if polygonOrder is None:
+            rank = lambda polygon: polygon
+        else:
+            rank = lambda polygon: polygonOrder[polygon]
+
+        boundaries = []
+        for run, (runStart, runEnd) in enumerate(zip(runStarts, runEnds)):
+            neighbour = neighbours[runStart]
+            polygon = edgePolygons[runStart]
+            if neighbour == Topology.NO_NEIGHBOUR or not rank(polygon) < rank(neighbour):
+                continue
+            ring = edgeRings[runStart]
+            ringStart, ringEnd = ringOffsets[ring], ringOffsets[ring + 1]
+            closesRing = runEnd < ringEnd and neighbours[ringEnd - 1] == neighbour
+            if runStart == ringStart and closesRing:
+                # Continued by the last run of the ring
+                continue
+            edges = np.arange(runStart, runEnd)
+            if runEnd == ringEnd and runStart > ringStart and neighbours[ringStart] == neighbour:
+                # The run wraps around the ring start
+                edges = np.concatenate((edges, np.arange(ringStart, runEnds[ringFirstRun[ring]])))
+            line = np.concatenate((coordinates[edges], coordinates[ends[edges[-1:]]]))
+            boundaries.append((int(polygon), int(neighbour), line))
+        return boundaries
+
+    @staticmethod
+    def _nextVertices(ringOffsets):
+        """
+        Index of the end vertex of each edge, the last edge of a ring ends at the ring start.
+        """
+        ends = np.arange(1, ringOffsets[-1] + 1, dtype=np.int64)
+        ends[ringOffsets[1:] - 1] = ringOffsets[:-1]
+        return ends
+
+    @staticmethod
+    def envelopePairs(envelopes):
+        """
+        Pairs of overlapping or touching envelopes, given as (n, 4) array of (minX, maxX, minY, maxY)
+        like OGR's GetEnvelope. Every envelope is entered into the cells of a uniform grid it covers, the
+        cell size is the median envelope extent, and only envelopes sharing a cell are compared. A pair is
+        kept in the one cell containing the lower left corner of the intersection of both envelopes,
+        so it is found once. Envelopes which are not finite, e.g. NaN for null geometries, are skipped.
+        Returns two index arrays.
+        """
+        envelopes = np.asarray(envelopes, dtype=np.float64).reshape(-1, 4)
+        indices = np.flatnonzero(np.isfinite(envelopes).all(axis=1))
+        envelopes = envelopes[indices]
+        count = len(envelopes)
+        pairsA = [np.zeros(0, dtype=np.int64)]
+        pairsB = [np.zeros(0, dtype=np.int64)]
+        if count < 2:
+            return pairsA[0], pairsB[0]
+        minX, maxX, minY, maxY = envelopes.T
+        width = maxX.max() - minX.min()
+        height = maxY.max() - minY.min()
+        # At least the cell size of about count cells over the whole extent
+        cellSize = max(np.median(np.maximum(maxX - minX, maxY - minY)), np.sqrt(width * height / count), width / count, height / count)
+        if not cellSize > 0:
+            cellSize = 1.0
+        x0 = np.floor((minX - minX.min()) / cellSize).astype(np.int64)
+        x1 = np.floor((maxX - minX.min()) / cellSize).astype(np.int64)
+        y0 = np.floor((minY - minY.min()) / cellSize).astype(np.int64)
+        y1 = np.floor((maxY - minY.min()) / cellSize).astype(np.int64)
+        columns = x1.max() + 1
+
+        # One entry per envelope and covered cell, sorted by cell
+        spanX = x1 - x0 + 1
+        cellCounts = spanX * (y1 - y0 + 1)
+        boxes = np.repeat(np.arange(count), cellCounts)
+        within = np.arange(len(boxes)) - np.repeat(np.cumsum(cellCounts) - cellCounts, cellCounts)
+        cellX = x0[boxes] + within % spanX[boxes]
+        cellY = y0[boxes] + within // spanX[boxes]
+        cells = cellY * columns + cellX
+        order = np.argsort(cells, kind='stable')
+        boxes, cellX, cellY, cells = boxes[order], cellX[order], cellY[order], cells[order]
+
+        # Each entry is paired with the following entries of its cell
+        entryCount = len(boxes)
+        counts = np.searchsorted(cells, cells, side='right') - np.arange(entryCount) - 1
+        cumulated = np.cumsum(counts)
+        start = 0
+        while start < entryCount:
+            base = cumulated[start - 1] if start > 0 else 0
+            stop = min(entryCount, max(start + 1, int(np.searchsorted(cumulated, base + Topology.PAIR_BATCH, side='right'))))
+            blockCounts = counts[start:stop]
+            first = np.repeat(np.arange(start, stop), blockCounts)
+            second = first + 1 + np.arange(blockCounts.sum()) - np.repeat(np.cumsum(blockCounts) - blockCounts, blockCounts)
+            a, b = boxes[first], boxes[second]
+            keep = ((minX[a] <= maxX[b]) & (minX[b] <= maxX[a]) & (minY[a] <= maxY[b]) & (minY[b] <= maxY[a]) & 
+                    (np.maximum(x0[a], x0[b]) == cellX[first]) & (np.maximum(y0[a], y0[b]) == cellY[first]))
+            pairsA.append(indices[a[keep]])
+            pairsB.append(indices[b[keep]])
+            start = stop
+        return np.concatenate(pairsA), np.concatenate(pairsB)
+
+    @staticmethod
+    def chainLines(lines, keys = None):
+        """
+        Joins lines, given as coordinate arrays, at end points where exactly two of them meet and,
+        if keys are given, both lines have the same key.
+        Returns the joined lines as coordinate arrays, with keys a list of (key, joined line).
+        """
+        ends = {}
+        for i, line in enumerate(lines):
+            ends.setdefault(tuple(line[0]), []).append((i, False))
+            ends.setdefault(tuple(line[-1]), []).append((i, True))
+        used = [False] * len(lines)
+
+        def joins(point):
+            meeting = ends[point]
+            return len(meeting) == 2 and (keys is None or keys[meeting[0][0]] == keys[meeting[1][0]])
+
+        def follow(point):
+            parts = []
+            while joins(point):
+                candidates = [(j, atEnd) for j, atEnd in ends[point] if not used[j]]
+                if not candidates:
+                    break
+                j, atEnd = candidates[0]
+                used[j] = True
+                coordinates = lines[j][::-1] if atEnd else lines[j]
+                parts.append(coordinates[1:])
+                point = tuple(coordinates[-1])
+            return parts
+
+        chains = []
+        for i, line in enumerate(lines):
+            if used[i]:
+                continue
+            used[i] = True
+            forward = follow(tuple(line[-1]))
+            backward = follow(tuple(line[0]))
+            # The reversed backward parts end next to the start point of the line
+            parts = [part[::-1] for part in reversed(backward)]
+            chain = np.concatenate(parts + [np.asarray(line)] + forward)
+            chains.append(chain if keys is None else (keys[i], chain))
+        return chains
+
+    @staticmethod
+    def simplifyLines(coordinates, offsets, tolerance):
+        """
+        Douglas-Peucker simplification of many lines at once, given as concatenated (n, 2) coordinates and the
+        line offsets (lines + 1 entries). Each pass splits all line sections which still deviate by more than the
+        tolerance at their farthest vertex. The end points of each line are kept, so lines which meet at their
+        ends still meet after simplification. Returns a mask of the kept vertices.
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        keep = np.zeros(len(coordinates), dtype=bool)
+        starts = offsets[:-1][offsets[1:] > offsets[:-1]]
+        ends = offsets[1:][offsets[1:] > offsets[:-1]] - 1
+        keep[starts] = True
+        keep[ends] = True
+        while True:
+            sections = ends - starts > 1
+            starts, ends = starts[sections], ends[sections]
+            if len(starts) == 0:
+                return keep
+            lengths = ends - starts - 1
+            section = np.repeat(np.arange(len(starts)), lengths)
+            bounds = np.cumsum(lengths) - lengths
+            points = np.arange(lengths.sum()) - bounds[section] + starts[section] + 1
+            first = coordinates[starts[section]]
+            direction = coordinates[ends[section]] - first
+            offset = coordinates[points] - first
+            norm = np.hypot(direction[:, 0], direction[:, 1])
+            cross = np.abs(direction[:, 0] * offset[:, 1] - direction[:, 1] * offset[:, 0])
+            # Distance to the section, to its start point for closed rings
+            distance = np.where(norm > 0, cross / np.where(norm > 0, norm, 1.0), np.hypot(offset[:, 0], offset[:, 1]))
+            maxima = np.maximum.reduceat(distance, bounds)
+            candidates = np.flatnonzero(distance == maxima[section])
+            farthest = points[candidates[np.unique(section[candidates], return_index=True)[1]]]
+            split = maxima > tolerance
+            farthest = farthest[split]
+            keep[farthest] = True
+            starts, ends = np.concatenate((starts[split], farthest)), np.concatenate((farthest, ends[split]))
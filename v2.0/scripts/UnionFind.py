@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ disjoint sets of integer labels, e.g. segments which are merged.
+ The lowest label of a set is its root, so merged labels can be mapped with one array lookup.
+"""
+
+# Import required modules
+import numpy as np
+
+class UnionFind():
+
+    def __init__(self, size = 0):
+        self._parents = np.arange(size, dtype=np.int64)
+
+    def size(self):
+        return len(self._parents)
+
+    def resize(self, size):
+        """
+        Extends the sets by single element sets up to size labels.
+        """
+        if size > len(self._parents):
+            self._parents = np.concatenate((self._parents, np.arange(len(self._parents), size, dtype=np.int64)))
+
+    def find(self, label):
+        parents = self._parents
+        while parents[label] != label:
+            parents[label] = parents[parents[label]]
+            label = parents[label]
+        return int(label)
+
+    def union(self, labelA, labelB):
+        """
+        Merges the sets of both labels, returns False if they were already in one set.
+        """
+        rootA = self.find(labelA)
+        rootB = self.find(labelB)
+        if rootA == rootB:
+            return False
+        if rootA < rootB:
+            self._parents[rootB] = rootA
+        else:
+            self._parents[rootA] = rootB
+        return True
+
+    def unionPairs(self, labelsA, labelsB):
+        """
+        Merges the sets of all label pairs, returns the number of merges.
+        """
+        merges = 0
+        for labelA, labelB in zip(labelsA, labelsB):
+            if self.union(labelA, labelB):
+                merges += 1
+        return merges
+
+    def roots(self):
+        """
+        Root label of every label as array, e.g. to relabel a label raster by roots[labels].
+        """
+        parents = self._parents
+        while True:
+            grandParents = parents[parents]
+            if np.array_equal(grandParents, parents):
+                break
+            parents = grandParents
+        self._parents = parents
+        return parents.copy()
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ its4land WP5: Automate It
+                              -------------------
+        begin                : 2018-05-23
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Sophie Crommelinck
+        email                : s.crommelinck@utwente.nl
+        development          : Reiner Borchert, Hansa Luftbild AG Münster
+        email                : borchert@hansaluftbild.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+"""
+!/bin/python
+-*- coding: utf-8 -*
+
+### Description ###
+ zonal statistics engine for the single sided buffers of a line layer.
+ Every pair of left/right buffers is rasterized once per raster grid and the raster is read window by window
+ for all registered bands at once, so all gradient attributes are derived in a single pass with bounded memory.
+ The measures of all zones of a window are reduced together; medians of integer bands come from per zone
+ histograms, float bands are sorted or, with a median tolerance, binned.
+"""
+
+# Import required modules
+import math
+import numpy as np
+from osgeo import ogr, gdal
+
+from RasterWindows import RasterWindows
+
+class ZonalStatistics():
+
+    NODATA = -999
+
+    ID_ATTRIB = 'ID'
+
+    MEASURES = {'median': np.median,
+                'mean': np.mean,
+                'min': np.min,
+                'max': np.max,
+                'std': np.std,
+                'sum': np.sum,
+                'count': np.size,
+                'range': np.ptp}
+
+    # Maximum number of histogram bins (zones * values) counted at once
+    HISTOGRAM_BINS = 1 << 22
+
+    def __init__(self, statsMeasure, nodata = NODATA, maxMemory = None, medianTolerance = None):
+        """
+        statsMeasure: one of MEASURES
+        nodata: pixel value excluded from the statistics
+        maxMemory: memory cap in bytes for the raster windows read at once
+        medianTolerance: bin width of approximate medians of float bands, exact medians by sorting if not set
+        """
+        if statsMeasure not in ZonalStatistics.MEASURES:
+            raise ValueError("Statistics measure '{0}' is not supported".format(statsMeasure))
+        self._statsMeasure = statsMeasure
+        self._nodata = nodata
+        self._maxMemory = maxMemory
+        self._medianTolerance = medianTolerance
+        self._rasters = []
+
+    def addRaster(self, fileName, bands, attributeNames):
+        """
+        Registers a raster file; the values of band bands[i] are stored in attribute attributeNames[i].
+        """
+        dataset = gdal.Open(fileName)
+        if dataset is None:
+            return False
+        self._rasters.append((dataset, list(bands), list(attributeNames)))
+        return True
+
+    def attributeNames(self):
+        names = []
+        for dataset, bands, attributeNames in self._rasters:
+            names.extend(attributeNames)
+        return names
+
+    def calculate(self, leftBuffers, rightBuffers):
+        """
+        Calculates the statistics measure of all registered bands for the left and right buffers.
+        leftBuffers and rightBuffers are buffer file names, OGR layers with an ID field or
+        lists of (ID, geometry) tuples.
+        Returns two lists of features ({'properties': {ID, attribute: measure, ...}}) in the order of
+        the left buffers, the right list is matched by ID.
+        """
+        leftGeometries = ZonalStatistics._loadGeometries(leftBuffers)
+        rightByID = dict(ZonalStatistics._loadGeometries(rightBuffers))
+        zones = [(leftGeometry, rightByID.get(featID)) for featID, leftGeometry in leftGeometries]
+        leftProps = [{ZonalStatistics.ID_ATTRIB: featID} for featID, leftGeometry in leftGeometries]
+        rightProps = [{ZonalStatistics.ID_ATTRIB: featID} for featID, leftGeometry in leftGeometries]
+
+        rasterizer = _Rasterizer(ZonalStatistics._spatialReference(leftBuffers))
+        for rasters in self._rastersByGrid():
+            self._calculateGrid(rasters, zones, leftProps, rightProps, rasterizer)
+        return [{'properties': props} for props in leftProps], [{'properties': props} for props in rightProps]
+
+    def _rastersByGrid(self):
+        """
+        Groups the registered rasters by pixel grid, rasters of one grid share windows and masks.
+        """
+        grids = {}
+        for raster in self._rasters:
+            grids.setdefault(ZonalStatistics._gridKey(raster[0]), []).append(raster)
+        return grids.values()
+
+    def _calculateGrid(self, rasters, zones, leftProps, rightProps, rasterizer):
+        dataset = rasters[0][0]
+        bytesPerPixel = sum(RasterWindows.bytesPerPixel(ds, bands) for ds, bands, attributeNames in rasters)
+        windows = RasterWindows(dataset, maxMemory=self._maxMemory, bytesPerPixel=bytesPerPixel)
+        windowX, windowY = windows.windowSize()
+
+        # Pixel windows of the zones, grouped by the raster window containing their center
+        zoneWindows = [ZonalStatistics._window(dataset, leftGeometry, rightGeometry) for leftGeometry, rightGeometry in zones]
+        indices = [i for i, window in enumerate(zoneWindows) if window is not None]
+        cols = [zoneWindows[i][0] + zoneWindows[i][2] // 2 for i in indices]
+        rows = [zoneWindows[i][1] + zoneWindows[i][3] // 2 for i in indices]
+        for windowIndex, items in windows.groupByWindow(cols, rows):
+            items = [indices[item] for item in items]
+
+            # Zones larger than a window are read in pieces of window size, one zone at a time
+            large = set(i for i in items if zoneWindows[i][2] * zoneWindows[i][3] > windowX * windowY)
+            for i in sorted(large):
+                xoff, yoff, xsize, ysize = zoneWindows[i]
+                pieces = [self._zoneValues(rasters, zones, [i], zoneWindows, 
+                                           (x, y, min(windowX, xoff + xsize - x), min(windowY, yoff + ysize - y)), rasterizer)
+                          for y in range(yoff, yoff + ysize, windowY) for x in range(xoff, xoff + xsize, windowX)]
+                zoneIndices = np.concatenate([piece[0] for piece in pieces])
+                bandValues = [np.concatenate(values) for values in zip(*[piece[1] for piece in pieces])]
+                self._storeMeasures(rasters, [i], zoneIndices, bandValues, leftProps, rightProps)
+
+            # The other zones are read together in regions of at most window size
+            for region, regionItems in ZonalStatistics._regions([i for i in items if i not in large], zoneWindows, windowX * windowY):
+                zoneIndices, bandValues = self._zoneValues(rasters, zones, regionItems, zoneWindows, region, rasterizer)
+                self._storeMeasures(rasters, regionItems, zoneIndices, bandValues, leftProps, rightProps)
+
+    @staticmethod
+    def _regions(items, zoneWindows, maxPixels):
+        """
+        Splits the items into groups whose zone windows are covered by a region of at most maxPixels.
+        Yields (region, item indices); the items are taken row by row, a group ends before the item which
+        would enlarge its region beyond maxPixels.
+        """
+        region = None
+        regionItems = []
+        for i in sorted(items, key=lambda i: (zoneWindows[i][1], zoneWindows[i][0])):
+            xoff, yoff, xsize, ysize = zoneWindows[i]
+            if region is None:
+                joined = (xoff, yoff, xoff + xsize, yoff + ysize)
+            else:
+                joined = (min(region[0], xoff), min(region[1], yoff), max(region[2], xoff + xsize), max(region[3], yoff + ysize))
+                if (joined[2] - joined[0]) * (joined[3] - joined[1]) > maxPixels:
+                    yield (region[0], region[1], region[2] - region[0], region[3] - region[1]), regionItems
+                    joined = (xoff, yoff, xoff + xsize, yoff + ysize)
+                    regionItems = []
+            region = joined
+            regionItems.append(i)
+        if regionItems:
+            yield (region[0], region[1], region[2] - region[0], region[3] - region[1]), regionItems
+
+    def _zoneValues(self, rasters, zones, items, zoneWindows, region, rasterizer):
+        """
+        Reads a region of all registered bands and returns the zone index of the pixels of the zones of the
+        items within the region and their values per band. Zone 2 * k is the left and 2 * k + 1 the right
+        buffer of items[k].
+        """
+        geoTransform = rasters[0][0].GetGeoTransform()
+        x0, y0, width, height = region
+        data = [RasterWindows.readWindow(ds, region, bands) for ds, bands, attributeNames in rasters]
+        zoneIndices = []
+        pixelIndices = []
+        for k, i in enumerate(items):
+            # Part of the zone window within the region
+            zoneX, zoneY, zoneWidth, zoneHeight = zoneWindows[i]
+            xoff, yoff = max(zoneX, x0), max(zoneY, y0)
+            xsize = min(zoneX + zoneWidth, x0 + width) - xoff
+            ysize = min(zoneY + zoneHeight, y0 + height) - yoff
+            if xsize <= 0 or ysize <= 0:
+                continue
+            for side, geometry in enumerate(zones[i]):
+                mask = rasterizer.rasterize(geometry, geoTransform, (xoff, yoff, xsize, ysize))
+                if mask is None:
+                    continue
+                rows, cols = np.nonzero(mask)
+                zoneIndices.append(np.full(len(rows), 2 * k + side, dtype=np.int64))
+                pixelIndices.append((rows + yoff - y0) * width + cols + xoff - x0)
+        zoneIndices = np.concatenate(zoneIndices) if zoneIndices else np.zeros(0, dtype=np.int64)
+        pixelIndices = np.concatenate(pixelIndices) if pixelIndices else np.zeros(0, dtype=np.int64)
+        return zoneIndices, [bandValues.ravel()[pixelIndices] for values in data for bandValues in values]
+
+    def _storeMeasures(self, rasters, items, zoneIndices, bandValues, leftProps, rightProps):
+        attributeNames = [attributeName for ds, bands, names in rasters for attributeName in names]
+        for values, attributeName in zip(bandValues, attributeNames):
+            valid = values != self._nodata
+            if values.dtype.kind == 'f':
+                valid &= ~np.isnan(values)
+            measures = ZonalStatistics.groupedMeasure(zoneIndices[valid], values[valid], 2 * len(items), 
+                                                      self._statsMeasure, self._medianTolerance)
+            for k, i in enumerate(items):
+                leftProps[i][attributeName] = None if np.isnan(measures[2 * k]) else float(measures[2 * k])
+                rightProps[i][attributeName] = None if np.isnan(measures[2 * k + 1]) else float(measures[2 * k + 1])
+
+    @staticmethod
+    def groupedMeasure(zones, values, zoneCount, statsMeasure, medianTolerance = None):
+        """
+        Statistics measure of the values of each zone in one vectorized pass.
+        zones are zone indices in range(zoneCount); returns an array of zoneCount measures, NaN for empty zones.
+        Medians of integer values are exact histogram medians, medians of float values are binned with
+        medianTolerance as bin width if it is set.
+        """
+        counts = np.bincount(zones, minlength=zoneCount)[:zoneCount]
+        result = np.full(zoneCount, np.nan)
+        filled = counts > 0
+        if statsMeasure == 'count':
+            result[filled] = counts[filled]
+            return result
+        if statsMeasure == 'median' and filled.any():
+            medians = ZonalStatistics._histogramMedian(zones, np.asarray(values), counts, medianTolerance)
+            if medians is not None:
+                result[filled] = medians[filled]
+                return result
+        values = np.asarray(values, dtype=np.float64)
+        if statsMeasure in ('sum', 'mean', 'std'):
+            sums = np.bincount(zones, weights=values, minlength=zoneCount)[:zoneCount]
+            if statsMeasure == 'sum':
+                result[filled] = sums[filled]
+                return result
+            means = np.zeros(zoneCount)
+            means[filled] = sums[filled] / counts[filled]
+            if statsMeasure == 'mean':
+                result[filled] = means[filled]
+                return result
+            deviations = np.bincount(zones, weights=(values - means[zones]) ** 2, minlength=zoneCount)[:zoneCount]
+            result[filled] = np.sqrt(deviations[filled] / counts[filled])
+            return result
+
+        # Order statistics on the values sorted within their zones
+        order = np.lexsort((values, zones))
+        sortedValues = values[order]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        ends = starts + counts[filled] - 1
+        if statsMeasure == 'median':
+            lower = starts + (counts[filled] - 1) // 2
+            upper = starts + counts[filled] // 2
+            result[filled] = (sortedValues[lower] + sortedValues[upper]) / 2
+        elif statsMeasure == 'min':
+            result[filled] = sortedValues[starts]
+        elif statsMeasure == 'max':
+            result[filled] = sortedValues[ends]
+        elif statsMeasure == 'range':
+            result[filled] = sortedValues[ends] - sortedValues[starts]
+        else:
+            raise ValueError("Statistics measure '{0}' is not supported".format(statsMeasure))
+        return result
+
+    @staticmethod
+    def _histogramMedian(zones, values, counts, tolerance):
+        """
+        Medians of the zones from histograms of the values, None if the values can't be binned.
+        Integer values are counted per value, so the medians are exact; float values are counted in bins
+        of width tolerance and the median is the center of its bin, i.e. it deviates at most tolerance / 2.
+        """
+        if values.dtype.kind in 'ui':
+            origin = int(values.min())
+            width = 1
+            center = 0.0
+            bins = values.astype(np.int64) - origin
+        elif tolerance and tolerance > 0:
+            origin = float(values.min())
+            width = float(tolerance)
+            center = 0.5
+            bins = np.floor((values - origin) / width).astype(np.int64)
+        else:
+            return None
+        binCount = int(bins.max()) + 1
+        if binCount > ZonalStatistics.HISTOGRAM_BINS:
+            return None
+
+        # Ranks of the lower and upper median within each zone
+        lowerRank = (counts - 1) // 2
+        upperRank = counts // 2
+        medians = np.full(len(counts), np.nan)
+
+        # The cumulated histograms of consecutive zones form one ascending array, the median bin of a zone
+        # is the first bin whose cumulated count exceeds the global rank of the median
+        zonesPerChunk = max(1, ZonalStatistics.HISTOGRAM_BINS // binCount)
+        for first in range(0, len(counts), zonesPerChunk):
+            last = min(first + zonesPerChunk, len(counts))
+            if last - first < len(counts):
+                selected = (zones >= first) & (zones < last)
+                chunkZones, chunkBins = zones[selected] - first, bins[selected]
+            else:
+                chunkZones, chunkBins = zones, bins
+            chunkCounts = counts[first:last]
+            filled = chunkCounts > 0
+            cumulated = np.cumsum(np.bincount(chunkZones * binCount + chunkBins, minlength=(last - first) * binCount))
+            starts = np.cumsum(chunkCounts) - chunkCounts
+            binOffsets = np.arange(last - first) * binCount
+            lowerBin = np.searchsorted(cumulated, (starts + lowerRank[first:last])[filled], side='right') - binOffsets[filled]
+            upperBin = np.searchsorted(cumulated, (starts + upperRank[first:last])[filled], side='right') - binOffsets[filled]
+            medians[first:last][filled] = origin + ((lowerBin + upperBin) / 2.0 + center) * width
+        return medians
+
+    @staticmethod
+    def _loadGeometries(buffers):
+        if isinstance(buffers, list):
+            return buffers
+        dataSource = None
+        layer = buffers
+        if isinstance(buffers, str):
+            dataSource = ogr.Open(buffers)
+            layer = dataSource.GetLayer()
+        geometries = []
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            if geometry is not None:
+                geometries.append((feature.GetField(ZonalStatistics.ID_ATTRIB), geometry.Clone()))
+        layer.ResetReading()
+        dataSource = None
+        return geometries
+
+    @staticmethod
+    def _spatialReference(buffers):
+        if isinstance(buffers, list):
+            return None
+        if isinstance(buffers, str):
+            dataSource = ogr.Open(buffers)
+            srs = dataSource.GetLayer().GetSpatialRef()
+            return srs.Clone() if srs is not None else None
+        return buffers.GetSpatialRef()
+
+    @staticmethod
+    def _gridKey(dataset):
+        return (dataset.GetGeoTransform(), dataset.RasterXSize, dataset.RasterYSize)
+
+    @staticmethod
+    def _window(dataset, *geometries):
+        """
+        Pixel window (xoff, yoff, xsize, ysize) covering the envelopes of all geometries, clipped to the raster.
+        """
+        minX = minY = math.inf
+        maxX = maxY = -math.inf
+        for geometry in geometries:
+            if geometry is not None:
+                x0, x1, y0, y1 = geometry.GetEnvelope()
+                minX, maxX = min(minX, x0), max(maxX, x1)
+                minY, maxY = min(minY, y0), max(maxY, y1)
+        if minX > maxX:
+            return None
+        originX, pixelWidth, rotX, originY, rotY, pixelHeight = dataset.GetGeoTransform()
+        col0 = int(math.floor((minX - originX) / pixelWidth))
+        col1 = int(math.ceil((maxX - originX) / pixelWidth))
+        row0 = int(math.floor((maxY - originY) / pixelHeight))
+        row1 = int(math.ceil((minY - originY) / pixelHeight))
+        col0, col1 = max(col0, 0), min(col1, dataset.RasterXSize)
+        row0, row1 = max(row0, 0), min(row1, dataset.RasterYSize)
+        if col1 <= col0 or row1 <= row0:
+            return None
+        return col0, row0, col1 - col0, row1 - row0
+
+
+class _Rasterizer():
+    """
+    burns single geometries into boolean masks, reusing one scratch vector layer
+    """
+
+    def __init__(self, spatialReference):
+        self._dataSource = ogr.GetDriverByName('MEMORY').CreateDataSource('rasterizer')
+        self._layer = self._dataSource.CreateLayer('zone', spatialReference)
+        self._rasterDriver = gdal.GetDriverByName('MEM')
+
+    def rasterize(self, geometry, geoTransform, window):
+        if geometry is None:
+            return None
+        xoff, yoff, xsize, ysize = window
+        originX, pixelWidth, rotX, originY, rotY, pixelHeight = geoTransform
+        raster = self._rasterDriver.Create('', xsize, ysize, 1, gdal.GDT_Byte)
+        raster.SetGeoTransform((originX + xoff * pixelWidth, pixelWidth, rotX,
+                                originY + yoff * pixelHeight, rotY, pixelHeight))
+        feature = ogr.Feature(self._layer.GetLayerDefn())
+        feature.SetGeometry(geometry)
+        self._layer.CreateFeature(feature)
+        try:
+            gdal.RasterizeLayer(raster, [1], self._layer, burn_values=[1])
+        finally:
+            self._layer.DeleteFeature(feature.GetFID())
+        return raster.GetRasterBand(1).ReadAsArray().astype(bool)
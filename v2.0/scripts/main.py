@@ -36,6 +36,7 @@
 from AttributeCalculation import AttributeCalculation
 from Classification import Classification
 from Segmentation import Segmentation
+from Benchmark import Benchmark
 
 from os import *
 from sys import argv, stdout
@@ -47,6 +48,7 @@ EDGE = 2
 ATTR = 3
 CRCL = 4
 PRD = 5
+SSTAT = 6
 HELP = 9
 
 SEED = 12
@@ -60,10 +62,13 @@ TRAIN = 21
 CLASS = 22
 PRED = 23
 
+BENCH_GRAD = 31
+BENCH_SEGM = 32
 
-argumentsCount = {QUIT:0, HELP:0, SEGM:1, EDGE:1, ATTR:3, CRCL:1, PRD:2, 
+argumentsCount = {QUIT:0, HELP:0, SEGM:1, EDGE:1, ATTR:3, CRCL:1, PRD:2, SSTAT:2, 
                   SEED:1, SEA:3, EDAT:3, SEAC:3, SEAP:4, 
-                  TRAIN:3, CLASS:1, PRED:4}
+                  TRAIN:3, CLASS:1, PRED:4,
+                  BENCH_GRAD:3, BENCH_SEGM:2}
 parameterMessage = {QUIT:"-q:  Quit", 
                     HELP:"-h:  Shows this parameter list", 
                     SEGM:"-s <fileName>:  Segmentation - input: raster file; output: segments file", 
@@ -71,12 +76,15 @@ parameterMessage = {QUIT:"-q:  Quit",
                     ATTR:"-a <fileName> <fileName> <fileName>:  calculate Attributes - input: RGB Raster, DSM Raster, edges file; output: calculated edges file", 
                     CRCL:"-c <fileName>:  Create Classifier - input: calculated edges file; output: classifier", 
                     PRD:"-p <fileName> <fileName>:  Predict boundaries - input: edges file, classifier; output: classified validation set", 
+                    SSTAT:"-ss <fileName> <fileName>:  Segment Statistics - input: segments file, RGB Raster; output: segments file with AREA, AVERAGE_n, STDDEV_n", 
 
                     SEED:"-se <fileName>:  input: raster file; output: edges file", 
                     SEA:"-sea <fileName> <fileName> <fileName>:  input: raster file, RGB Raster, DSM Raster; output: calculated edges file", 
                     EDAT:"-ea <fileName> <fileName> <fileName>:  input: RGB Raster, DSM Raster, edges file; output: calculated edges file", 
                     SEAC:"-seac <fileName> <fileName> <fileName>:  input: raster file, RGB Raster, DSM Raster; output: classifier", 
                     SEAP:"-seap <fileName> <fileName> <fileName> <classifier>:  input: raster file, RGB Raster, DSM Raster, classifier; output: classified edges file",
+                    BENCH_GRAD:"-bg <fileName> <fileName> <fileName>:  Benchmark gradient modes - input: RGB Raster, DSM Raster, edges file; output: benchmark CSV file",
+                    BENCH_SEGM:"-bs <fileName> <fileName>:  Benchmark segmentation parameters - input: RGB Raster, RGB Raster; output: benchmark CSV file",
 
                     TRAIN:"-train:  Create Training Set - input: raster file, RGB Raster, DSM Raster; output: calculated training set", 
                     CLASS:"-class:  Create Classifier - input: training set; output: classifier", 
@@ -86,9 +94,10 @@ outputData = None
 testMode = False
 
 def parseArguments (args):
-    arguments = {"-q":QUIT, "-h":HELP, "-s":SEGM, "-e":EDGE, "-a":ATTR, "-c":CRCL, "-p": PRD, 
+    arguments = {"-q":QUIT, "-h":HELP, "-s":SEGM, "-e":EDGE, "-a":ATTR, "-c":CRCL, "-p": PRD, "-ss":SSTAT, 
                  "-se":SEED, "-sea":SEA, "-ea":EDAT, "-seac":SEAC, "-seap":SEAP,
-                 "-train":TRAIN, "-class":CLASS, "-pred":PRED}
+                 "-train":TRAIN, "-class":CLASS, "-pred":PRED,
+                 "-bg":BENCH_GRAD, "-bs":BENCH_SEGM}
     modID = None
     inputParams = []
     i = 0
@@ -117,12 +126,15 @@ def executeParams (modID, inputParams):
             print(parameterMessage[ATTR])
             print(parameterMessage[CRCL])
             print(parameterMessage[PRD])
+            print(parameterMessage[SSTAT])
             
             print(parameterMessage[SEED])
             print(parameterMessage[SEA])
             print(parameterMessage[EDAT])
             print(parameterMessage[SEAC])
             print(parameterMessage[SEAP])
+            print(parameterMessage[BENCH_GRAD])
+            print(parameterMessage[BENCH_SEGM])
         print(parameterMessage[TRAIN])
         print(parameterMessage[CLASS])
         print(parameterMessage[PRED])
@@ -153,6 +165,10 @@ def executeParams (modID, inputParams):
             elif modID == PRD:
                 process = Classification()
                 outputData = process.applyClassifier(inputParams[1], inputParams[0])
+            elif modID == SSTAT:
+                process = Segmentation()
+                if process.addSegmentStatistics(inputParams[0], inputParams[1]):
+                    outputData = inputParams[0]
             elif modID == SEED:
                 process = Segmentation()
                 fileName = process.createSegmentation(inputParams[0])
@@ -184,6 +200,12 @@ def executeParams (modID, inputParams):
                 fileName = process.runAll(inputParams[1], inputParams[2], fileName)
                 process = Classification()
                 outputData = process.applyClassifier(inputParams[3], fileName)
+            elif modID == BENCH_GRAD:
+                process = Benchmark()
+                outputData = process.compareGradientModes(inputParams[0], inputParams[1], inputParams[2])
+            elif modID == BENCH_SEGM:
+                process = Benchmark()
+                outputData = process.sweepSegmentation(inputParams)
         modID = HELP
     return modID
 
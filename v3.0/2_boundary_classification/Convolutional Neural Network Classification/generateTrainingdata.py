@@ -45,6 +45,7 @@ noboundaryDict = r"path_to_no_boundary_tiles_folder"
 MCGpointsFile = "path_to_MCG_points_shapefile"
 FiveBandRasterFile = "path_to_5bandraster"
 tileDimension = 224
+maxWindowMemory = 256 * 1024 * 1024  # bytes of label data read at once
 
 # Start timing
 start = time.time()
@@ -80,21 +81,23 @@ pixelHeight = geotransform[5]
 # Print info
 print("%i points to be processed for a raster of %i rows and %i cols..." % (points, rows, cols))
 
-# Read data
+# Get bands, the whole raster does not need to fit into memory
 band1 = ds.GetRasterBand(1)
-red = band1.ReadAsArray(0, 0, cols, rows).astype(int)
-
 band2 = ds.GetRasterBand(2)
-green = band2.ReadAsArray(0, 0, cols, rows).astype(int)
-
 band3 = ds.GetRasterBand(3)
-blue = band3.ReadAsArray(0, 0, cols, rows).astype(int)
-
 band4 = ds.GetRasterBand(4)
-cad = band4.ReadAsArray(0, 0, cols, rows).astype(int)
-
 band5 = ds.GetRasterBand(5)
-mcg = band5.ReadAsArray(0, 0, cols, rows).astype(int)
+
+# Divide raster into block aligned windows, cad and mcg of one window fit into maxWindowMemory
+blockX, blockY = band4.GetBlockSize()
+blockX = min(blockX, cols)
+blockY = min(blockY, rows)
+bytesPerPixel = (gdal.GetDataTypeSize(band4.DataType) + gdal.GetDataTypeSize(band5.DataType)) // 8
+windowBlocks = max(1, int(maxWindowMemory // (bytesPerPixel * blockX * blockY)))
+windowBlocksX = max(1, min(int(ceil(cols / blockX)), int(sqrt(windowBlocks))))
+windowX = windowBlocksX * blockX
+windowY = max(1, windowBlocks // windowBlocksX) * blockY
+windowCols = int(ceil(cols / windowX))
 
 # Prepare output rasters
 driver = gdal.GetDriverByName('GTiff')
@@ -108,9 +111,9 @@ outboundFail = 0
 createRasterFail = 0
 loop = 0
 
-# Loop over all features in input
+# Group points by the window containing their pixel
+windowPoints = {}
 for feature in layer:
-    loop += 1
     # Get geometry of feature
     geometry = feature.GetGeometryRef()
 
@@ -123,63 +126,76 @@ for feature in layer:
     yOffset = int((y - originY) / pixelHeight)
 
     if (xOffset < 0) or (yOffset < 0) or (xOffset - tileDimension / 2 < 0) or (xOffset > cols - tileDimension/2) or (yOffset - tileDimension / 2 < 0) or (yOffset > rows - tileDimension/2):
+        loop += 1
         outboundFail+=1
         continue
 
-    try:
-        # Check if cad and mcg are 1 and define output file name
-        featID = feature.GetField('ID')
-        if ((cad[yOffset, xOffset] == 1) and (mcg[yOffset, xOffset] == 1)):
-            bTileCount += 1
-            outrasterFilename = boundaryDict + r"\b1_" + str(featID) + "_" + str(bTileCount) + ".tif"
-
-        else:
-            nbTileCount += 1
-            outrasterFilename = noboundaryDict + r"\b0_" + str(featID) + "_" + str(nbTileCount) + ".tif"
-
-        # Create 3-band raster with dimension 224 x 224 around point
-        xOffsetClip = int(xOffset-tileDimension/2)
-        yOffsetClip = int(yOffset-tileDimension/2)
-        originXClip = x - tileDimension/2*pixelWidth
-        originYClip = y - tileDimension/2*pixelHeight
-
-        outRaster = driver.Create(outrasterFilename, tileDimension, tileDimension, 3, gdal.GDT_Byte)
-        outRaster.SetGeoTransform((originXClip, pixelWidth, 0, originYClip, 0, pixelHeight))
-        outRaster.SetProjection(rasterSRS.ExportToWkt())
-
-        redClip = band1.ReadAsArray(xOffsetClip, yOffsetClip, tileDimension, tileDimension).astype(int)
-        greenClip = band2.ReadAsArray(xOffsetClip, yOffsetClip, tileDimension, tileDimension).astype(int)
-        blueClip = band3.ReadAsArray(xOffsetClip, yOffsetClip, tileDimension, tileDimension).astype(int)
-
-        outBandRed = outRaster.GetRasterBand(1)
-        outBandRed.WriteArray(redClip)
-
-        outBandGreen = outRaster.GetRasterBand(2)
-        outBandGreen.WriteArray(greenClip)
-
-        outBandBlue = outRaster.GetRasterBand(3)
-        outBandBlue.WriteArray(blueClip)
-
-        outRaster.FlushCache()
-        del outRaster
-        redClip = None
-        greenClip = None
-        blueClip = None
-
-
-        if loop % 10000 == 0:
-            print("Processing ongoing (%i%%)" % (loop/points*100))
-
-    except:
-        createRasterFail+=1
-        print("Error in tile handling.")
+    window = (yOffset // windowY) * windowCols + xOffset // windowX
+    windowPoints.setdefault(window, []).append((feature.GetField('ID'), x, y, xOffset, yOffset))
+layer.ResetReading()
+
+# Loop over all windows and their points
+for window in sorted(windowPoints):
+    windowXOffset = (window % windowCols) * windowX
+    windowYOffset = (window // windowCols) * windowY
+    windowXSize = min(windowX, cols - windowXOffset)
+    windowYSize = min(windowY, rows - windowYOffset)
+    # Kept in the band data types budgeted in bytesPerPixel
+    cad = band4.ReadAsArray(windowXOffset, windowYOffset, windowXSize, windowYSize)
+    mcg = band5.ReadAsArray(windowXOffset, windowYOffset, windowXSize, windowYSize)
+
+    for featID, x, y, xOffset, yOffset in windowPoints[window]:
+        loop += 1
+        try:
+            # Check if cad and mcg are 1 and define output file name
+            if ((cad[yOffset - windowYOffset, xOffset - windowXOffset] == 1) and (mcg[yOffset - windowYOffset, xOffset - windowXOffset] == 1)):
+                bTileCount += 1
+                outrasterFilename = boundaryDict + r"\b1_" + str(featID) + "_" + str(bTileCount) + ".tif"
+
+            else:
+                nbTileCount += 1
+                outrasterFilename = noboundaryDict + r"\b0_" + str(featID) + "_" + str(nbTileCount) + ".tif"
+
+            # Create 3-band raster with dimension 224 x 224 around point
+            xOffsetClip = int(xOffset-tileDimension/2)
+            yOffsetClip = int(yOffset-tileDimension/2)
+            originXClip = x - tileDimension/2*pixelWidth
+            originYClip = y - tileDimension/2*pixelHeight
+
+            outRaster = driver.Create(outrasterFilename, tileDimension, tileDimension, 3, gdal.GDT_Byte)
+            outRaster.SetGeoTransform((originXClip, pixelWidth, 0, originYClip, 0, pixelHeight))
+            outRaster.SetProjection(rasterSRS.ExportToWkt())
+
+            redClip = band1.ReadAsArray(xOffsetClip, yOffsetClip, tileDimension, tileDimension).astype(int)
+            greenClip = band2.ReadAsArray(xOffsetClip, yOffsetClip, tileDimension, tileDimension).astype(int)
+            blueClip = band3.ReadAsArray(xOffsetClip, yOffsetClip, tileDimension, tileDimension).astype(int)
+
+            outBandRed = outRaster.GetRasterBand(1)
+            outBandRed.WriteArray(redClip)
+
+            outBandGreen = outRaster.GetRasterBand(2)
+            outBandGreen.WriteArray(greenClip)
+
+            outBandBlue = outRaster.GetRasterBand(3)
+            outBandBlue.WriteArray(blueClip)
+
+            outRaster.FlushCache()
+            del outRaster
+            redClip = None
+            greenClip = None
+            blueClip = None
+
+
+            if loop % 10000 == 0:
+                print("Processing ongoing (%i%%)" % (loop/points*100))
+
+        except:
+            createRasterFail+=1
+            print("Error in tile handling.")
 
 # Clean up
 datasource = None
 ds = None
-red = None
-green = None
-blue = None
 cad = None
 mcg = None
 end = time.time()